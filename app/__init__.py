@@ -1,17 +1,33 @@
+import time
 from flask import Flask
 from flask_bootstrap import Bootstrap
-from flask_mail import Mail
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from config import config
 from flask_login import LoginManager
+from .presence import Presence
+from .cache import UserCache, ProfileCache
+from .hashing import PasswordHasher
+from .tokens import Tokens
+from .bloom import TakenNames
+from .profiling import Profiler
+from .routing import RoutingSQLAlchemy
+from .templating import TemplateCache
+from .lazy import LazyExtension
 
 
 bootstrap = Bootstrap()
-mail = Mail()
-moment = Moment()
-db = SQLAlchemy()
+# Flask-Mail和Flask-Moment可以推迟到第一次使用时再导入和初始化，见FLASKY_LAZY_EXTENSIONS
+mail = LazyExtension('flask_mail:Mail', 'mail')
+moment = LazyExtension('flask_moment:Moment', 'moment', first_request=True)
+db = RoutingSQLAlchemy()
 login_manager = LoginManager()
+presence = Presence()
+user_cache = UserCache()
+profile_cache = ProfileCache()
+hasher = PasswordHasher()
+tokens = Tokens()
+taken_names = TakenNames()
+profiler = Profiler()
+template_cache = TemplateCache()
 # login_view属性设置登录页面的端点
 login_manager.login_view = 'auth.login'
 
@@ -19,12 +35,19 @@ def create_app(config_name):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
-    bootstrap.init_app(app)
-    mail.init_app(app)
-    moment.init_app(app)
-    db.init_app(app)
-    login_manager.init_app(app)
+    # 记录各扩展的初始化耗时，供flask startup-report使用
+    startup = app.extensions['startup'] = []
+    for name, extension in (('bootstrap', bootstrap), ('mail', mail), ('moment', moment),
+                            ('db', db), ('login_manager', login_manager), ('presence', presence),
+                            ('user_cache', user_cache), ('profile_cache', profile_cache),
+                            ('hasher', hasher), ('tokens', tokens),
+                            ('taken_names', taken_names), ('profiler', profiler),
+                            ('template_cache', template_cache)):
+        start = time.perf_counter()
+        extension.init_app(app)
+        startup.append((name, (time.perf_counter() - start) * 1000))
 
+    start = time.perf_counter()
     # 注册主蓝本。
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -34,4 +57,20 @@ def create_app(config_name):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
+    # 注册管理员蓝本
+    from .admin import admin as admin_blueprint
+    app.register_blueprint(admin_blueprint, url_prefix='/admin')
+    startup.append(('blueprints', (time.perf_counter() - start) * 1000))
+
+    # 蓝本注册后才能列出全部模板
+    if app.config['FLASKY_TEMPLATE_WARMUP']:
+        start = time.perf_counter()
+        template_cache.warm(app)
+        startup.append(('template_warmup', (time.perf_counter() - start) * 1000))
+
+    if app.config['FLASKY_REGISTRATION_BLOOM_WARMUP']:
+        start = time.perf_counter()
+        taken_names.warm_app(app)
+        startup.append(('registration_bloom_warmup', (time.perf_counter() - start) * 1000))
+
     return app
\ No newline at end of file
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from flask import render_template, request, abort, current_app, url_for, Response, stream_with_context
+from flask_login import login_required
+from sqlalchemy.orm import joinedload
+from . import admin
+from ..decorators import admin_required
+from ..models import User, Role
+from ..querybudget import query_budget
+
+
+EXPORT_FIELDS = ('id', 'username', 'email', 'role', 'confirmed', 'member_since', 'last_seen')
+FILTERS = ('role', 'confirmed', 'since', 'until')
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400)
+
+# 按请求参数过滤用户；指定角色时从Role.users动态关系开始查询
+def _directory_query():
+    role_name = request.args.get('role')
+    if role_name:
+        query = Role.query.filter_by(name=role_name).first_or_404().users
+    else:
+        query = User.query
+    confirmed = request.args.get('confirmed')
+    if confirmed in ('0', '1'):
+        query = query.filter(User.confirmed == (confirmed == '1'))
+    since = _parse_date(request.args.get('since'))
+    if since is not None:
+        query = query.filter(User.member_since >= since)
+    until = _parse_date(request.args.get('until'))
+    if until is not None:
+        query = query.filter(User.member_since < until + timedelta(days=1))
+    return query
+
+def _filters():
+    return {key: request.args[key] for key in FILTERS if request.args.get(key)}
+
+# 用户目录，按主键做键集分页：下一页从上一页最后一个ID之后开始，不使用OFFSET
+@admin.route('/users')
+@query_budget(4)
+@login_required
+@admin_required
+def users():
+    per_page = max(1, min(request.args.get('per_page', current_app.config['FLASKY_USERS_PER_PAGE'], type=int), 500))
+    after = request.args.get('after', 0, type=int)
+    rows = _directory_query().options(joinedload(User.role)) \
+        .filter(User.id > after).order_by(User.id).limit(per_page + 1).all()
+    next_url = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_url = url_for('.users', after=rows[-1].id, per_page=per_page, **_filters())
+    roles = Role.query.order_by(Role.name).all()
+    return render_template('admin/users.html', users=rows, roles=roles, filters=_filters(),
+                           next_url=next_url, first_page=not after)
+
+def _export_row(row):
+    user_id, username, email, role, confirmed, member_since, last_seen = row
+    return (user_id, username, email, role, bool(confirmed),
+            member_since.isoformat() if member_since else None,
+            last_seen.isoformat() if last_seen else None)
+
+def _format_csv(rows, header=False):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows(rows)
+    return buf.getvalue()
+
+def _format_ndjson(rows, header=False):
+    return ''.join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n' for row in rows)
+
+# 流式导出：每次按键集读取一批只含所需列的元组，内存占用与导出总数无关
+@admin.route('/users/export')
+@login_required
+@admin_required
+def export_users():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        abort(400)
+    formatter = _format_csv if fmt == 'csv' else _format_ndjson
+    query = _directory_query().outerjoin(Role, User.role_id == Role.id) \
+        .with_entities(User.id, User.username, User.email, Role.name, User.confirmed,
+                       User.member_since, User.last_seen)
+    batch_size = current_app.config['FLASKY_EXPORT_BATCH_SIZE']
+
+    def generate():
+        last_id = 0
+        header = True
+        while True:
+            rows = query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+            if not rows:
+                if header:
+                    yield formatter([], header=True)
+                break
+            yield formatter([_export_row(row) for row in rows], header=header)
+            header = False
+            last_id = rows[-1][0]
+
+    filename = 'users-%s.%s' % (datetime.utcnow().strftime('%Y%m%d'), fmt)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=%s' % filename})
@@ -22,13 +22,19 @@ class RegistrationForm(FlaskForm):
     password2 = PasswordField('Confirm password', validators=[DataRequired()])
     submit = SubmitField('Register')
 
+    # 邮箱和用户名的检查共用一次查询，结果在表单实例上缓存
+    def _taken(self):
+        if not hasattr(self, '_taken_result'):
+            self._taken_result = User.taken(self.email.data, self.username.data)
+        return self._taken_result
+
     # 表单类中定义了validate_开头且后面跟着字段名的方法，则此方法和常规的验证函数一起调用
     def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first():
+        if self._taken()[0]:
             raise ValidationError('Email already registered.')
 
     def validate_username(self, field):
-        if User.query.filter_by(username=field.data).first():
+        if self._taken()[1]:
             raise ValidationError('Username already in use.')
 
 class ChangePasswordForm(FlaskForm):
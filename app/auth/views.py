@@ -1,20 +1,23 @@
 from flask import render_template, redirect, request, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from . import auth
 from .. import db
 from ..models import User
 from .forms import LoginForm, RegistrationForm, ChangePasswordForm, PasswordResetForm, PasswordResetRequestForm, ChangeEmailForm
-from ..email import send_email
+from ..outbox import queue_email
+from ..querybudget import query_budget
 
 
 # 用户登录路由
 @auth.route('/login', methods=['GET', 'POST'])
+@query_budget(1)
 def login() -> 'html':
     form = LoginForm()
     # 判断请求是不是POST
     if form.validate_on_submit():
         # 通过email查询数据库内是否有存在用户
-        user = User.query.filter_by(email=form.email.data).first()
+        user = User.lookup_email(form.email.data).first()
         # 判断是否返回用户以及密码是否匹配
         if user is not None and user.verify_password(form.password.data):
             login_user(user, form.remember_me.data)
@@ -28,6 +31,7 @@ def login() -> 'html':
 
 # 用户退出路由
 @auth.route('/logout')
+@query_budget(1)
 @login_required
 def logout():
     logout_user()
@@ -36,27 +40,36 @@ def logout():
 
 # 用户注册路由
 @auth.route('/register', methods=['GET', 'POST'])
+@query_budget(4)
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(email=form.email.data, username=form.username.data, password=form.password.data)
         db.session.add(user)
-        db.session.commit()
-        # 生成令牌并发送注册确认邮件
+        # 先flush获得用户ID，再生成令牌，确认邮件与新用户在同一事务中提交
+        # 预过滤器只在本进程内更新，并发注册时由数据库唯一约束兜底
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Email or username already registered.')
+            return render_template('auth/register.html', form=form)
         token = user.generate_confirmation_token()
-        send_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user, token=token)
+        queue_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user, token=token)
+        db.session.commit()
         flash('A confirmation email has been sent to you by email.')
         return redirect(url_for('main.index'))
     return render_template('auth/register.html', form=form)
 
 # 用户注册令牌验证
 @auth.route('/confirm/<token>')
+@query_budget(3)
 @login_required
 def confirm(token):
     if current_user.confirmed:
         return redirect(url_for('main.index'))
     # 判断令牌有效性
-    if current_user.confirm(token):
+    if current_user.user.confirm(token):
         db.session.commit()
         flash('You have confirmed your account. Thanks!')
     else:
@@ -65,26 +78,31 @@ def confirm(token):
 
 # 用户注册生成令牌
 @auth.route('/confirm')
+@query_budget(3)
 @login_required
 def resend_confirmation():
     if current_user.confirmed:
         flash("You've confirmed it")
         return redirect(url_for('main.index'))
-    token = current_user.generate_confirmation_token()
-    send_email(current_user.email, 'Confirm Your Account', 'auth/email/confirm', user=current_user, token=token)
+    user = current_user.user
+    token = user.generate_confirmation_token()
+    queue_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user, token=token)
+    db.session.commit()
     flash('A new confirmation email has been sent to you by email.')
     return redirect(url_for('main.index'))
 
 # 用户更改密码
 @auth.route('/change_password', methods=['GET', 'POST'])
+@query_budget(3)
 @login_required
 def change_password() -> 'html':
     form = ChangePasswordForm()
     if form.validate_on_submit():
         # 确认旧密码正确
-        if current_user.verify_password(form.old_password.data):
-            current_user.password = form.password.data
-            db.session.add(current_user)
+        user = current_user.user
+        if user.verify_password(form.old_password.data):
+            user.password = form.password.data
+            db.session.add(user)
             db.session.commit()
             flash('您的密码已更新')
             return redirect(url_for('main.index'))
@@ -94,21 +112,24 @@ def change_password() -> 'html':
 
 # 用户重置密码
 @auth.route('/reset', methods=['GET', 'POST'])
+@query_budget(2)
 def password_reset_request() -> 'html':
     if not current_user.is_anonymous:
         return redirect(url_for('main.index'))
     form = PasswordResetRequestForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data.lower()).first()
+        user = User.lookup_email(form.email.data).first()
         if user:
             token = user.generate_reset_token()
-            send_email(user.email, 'Reset Your Password', 'auth/email/reset_password', user=user, token=token)
+            queue_email(user.email, 'Reset Your Password', 'auth/email/reset_password', user=user, token=token)
+            db.session.commit()
         flash('An email with instructions to reset your password has been sent to you.')
         return redirect(url_for('auth.login'))
     return render_template('auth/reset_password.html', form=form)
 
 # 用户重置密码，验证令牌
 @auth.route('/reset/<token>', methods=['GET', 'POST'])
+@query_budget(2)
 def password_reset(token):
     if not current_user.is_anonymous:
         return redirect('main.index')
@@ -125,22 +146,26 @@ def password_reset(token):
 
 # 用户更改email地址
 @auth.route('/change_email', methods=['GET', 'POST'])
+@query_budget(3)
 @login_required
 def change_email():
     form = ChangeEmailForm()
     if form.validate_on_submit():
-        token = current_user.generate_change_email_token(form.email.data)
-        send_email(form.email.data, '更换你的邮箱', 'auth/email/change_email', user=current_user, token=token)
+        user = current_user.user
+        token = user.generate_change_email_token(form.email.data)
+        queue_email(form.email.data, '更换你的邮箱', 'auth/email/change_email', user=user, token=token)
+        db.session.commit()
         flash('一封确认邮件已经发送到您的新邮箱中，请及时查收并确认。')
         return redirect(url_for('main.index'))
     return render_template('auth/change_email.html', form=form)
 
 # 用户更改email令牌验证
 @auth.route('/change_email/<token>')
+@query_budget(3)
 @login_required
 def change_email_confirm(token):
     # 判断令牌有效性
-    if current_user.change_email_confirm(token):
+    if current_user.user.change_email_confirm(token):
         db.session.commit()
         flash('你的邮箱已经更新成功！')
     else:
@@ -160,6 +185,7 @@ def before_request():
             return redirect(url_for('auth.unconfirmed'))
 
 @auth.route('/unconfirmed')
+@query_budget(1)
 def unconfirmed():
     if current_user.is_anonymous or current_user.confirmed:
         return redirect(url_for('main.index'))
@@ -0,0 +1,184 @@
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+from . import create_app, db
+from .models import User, Role
+
+
+PASSWORD = 'bench-password'
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    # 最近秩法：取排序后的第ceil(p% * n)个值
+    index = max(0, min(len(values) - 1, math.ceil(p / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+# 批量写入测试用户，所有用户使用同一个密码哈希以缩短准备时间
+def seed_users(app, count, batch_size=5000):
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        role = Role.query.filter_by(default=True).first()
+        pwhash = generate_password_hash(PASSWORD, app.config['FLASKY_PASSWORD_HASH_METHOD'])
+        now = datetime.utcnow()
+        rows = []
+        for i in range(count):
+            username = 'bench%d' % i
+            email = '%s@example.com' % username
+            rows.append({'username': username, 'username_normalized': username,
+                         'email': email, 'email_normalized': email, 'role_id': role.id,
+                         'password_hash': pwhash, 'confirmed': True,
+                         'member_since': now, 'last_seen': now, 'updated_at': now})
+            if len(rows) >= batch_size:
+                db.session.execute(User.__table__.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+
+
+class Scenario:
+    """一个被测端点：prepare在每个线程中执行一次，request发起一次请求并返回响应。"""
+
+    def __init__(self, name, request, prepare=None):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+
+
+def _login(client, i):
+    return client.post('/auth/login', data={'email': 'bench%d@example.com' % i, 'password': PASSWORD})
+
+
+def scenarios(users):
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def register(client):
+        with lock:
+            n = next(counter)
+        name = 'new%d_%d' % (os.getpid(), n)
+        return client.post('/auth/register', data={'email': name + '@example.com', 'username': name,
+                                                   'password': PASSWORD, 'password2': PASSWORD})
+
+    def login_once(client):
+        _login(client, random.randrange(users))
+
+    return [
+        Scenario('auth.login', lambda client: _login(client.application.test_client(), random.randrange(users))),
+        Scenario('auth.register', lambda client: register(client.application.test_client())),
+        Scenario('main.user', lambda client: client.get('/user/bench%d' % random.randrange(users))),
+        # 已登录用户访问首页，主要开销在before_request
+        Scenario('before_request', lambda client: client.get('/'), prepare=login_once),
+    ]
+
+
+def run_scenario(app, scenario, requests, concurrency):
+    per_worker = max(1, requests // concurrency)
+
+    def worker():
+        client = app.test_client(use_cookies=True)
+        if scenario.prepare is not None:
+            scenario.prepare(client)
+        latencies, errors = [], 0
+        for _ in range(per_worker):
+            start = time.perf_counter()
+            response = scenario.request(client)
+            # 被拒绝的请求（如哈希队列已满返回503）很快返回，计入延迟会让结果显得更好，只单独计数
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [f.result() for f in [executor.submit(worker) for _ in range(concurrency)]]
+    elapsed = time.perf_counter() - start
+    latencies = [value for lat, _ in results for value in lat]
+    errors = sum(errors for _, errors in results)
+    total = len(latencies) + errors
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        # 吞吐只计算成功的请求
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50': round(percentile(latencies, 50), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+    }
+
+
+def run_benchmark(config_name='benchmark', users=1000, requests=500, concurrency=8, only=None):
+    """在临时数据库中准备用户并依次压测各端点，返回{端点: 结果}。"""
+    workdir = tempfile.mkdtemp(prefix='flasky-bench-')
+    try:
+        app = create_app(config_name)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.sqlite')
+        seed_users(app, users)
+        results = {}
+        for scenario in scenarios(users):
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = run_scenario(app, scenario, requests, concurrency)
+        # 临时数据库删除前写入缓冲的访问时间，避免退出时再写入
+        app.extensions['presence'].flush()
+        db.get_engine(app).dispose()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def error_rate(result):
+    # 早期保存的基线没有error_rate字段
+    if 'error_rate' in result:
+        return result['error_rate']
+    return result['errors'] / result['requests'] if result.get('requests') else 0.0
+
+
+# 与基线比较：错误率高于基线，或吞吐下降、p95延迟上升超过阈值即视为退化
+def compare(results, baseline, threshold=0.2):
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if error_rate(current) > error_rate(base):
+            regressions.append('%s: error rate %.1f%% vs baseline %.1f%%'
+                               % (name, error_rate(current) * 100, error_rate(base) * 100))
+        if base['rps'] and current['rps'] < base['rps'] * (1 - threshold):
+            regressions.append('%s: %.1f req/s vs baseline %.1f' % (name, current['rps'], base['rps']))
+        if base['p95'] and current['p95'] > base['p95'] * (1 + threshold):
+            regressions.append('%s: p95 %.1fms vs baseline %.1fms' % (name, current['p95'], base['p95']))
+    return regressions
+
+
+def format_results(results):
+    lines = ['%-16s %8s %7s %10s %9s %9s %9s' % ('endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms')]
+    for name, r in results.items():
+        lines.append('%-16s %8d %7d %10.1f %9.2f %9.2f %9.2f'
+                     % (name, r['requests'], r['errors'], r['rps'], r['p50'], r['p95'], r['p99']))
+    return '\n'.join(lines)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import math
+import threading
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """布隆过滤器：判断为不存在的键一定不存在，判断为存在的键可能误判。"""
+
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    # 用一次blake2b摘要拆成两个哈希值，组合出k个位置
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for pos in positions:
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class TakenNames:
+    """已注册的邮箱和用户名预过滤器，大多数可用名称的检查不必访问数据库。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_REGISTRATION_BLOOM', True)
+        app.config.setdefault('FLASKY_REGISTRATION_BLOOM_CAPACITY', 1000000)
+        app.config.setdefault('FLASKY_REGISTRATION_BLOOM_ERROR_RATE', 0.01)
+        app.config.setdefault('FLASKY_REGISTRATION_BLOOM_WARMUP', False)
+        app.extensions['taken_names'] = {'filter': None, 'lock': threading.Lock()}
+
+    @staticmethod
+    def email_key(email):
+        return 'e:' + (email or '').strip().lower()
+
+    @staticmethod
+    def username_key(username):
+        return 'u:' + (username or '').strip().lower()
+
+    # 从数据库加载全部已注册的邮箱和用户名；在第一次检查时自动执行
+    def warm(self):
+        state = current_app.extensions['taken_names']
+        if not current_app.config['FLASKY_REGISTRATION_BLOOM']:
+            return None
+        with state['lock']:
+            if state['filter'] is None:
+                from . import db
+                from .models import User
+                bloom = BloomFilter(current_app.config['FLASKY_REGISTRATION_BLOOM_CAPACITY'],
+                                    current_app.config['FLASKY_REGISTRATION_BLOOM_ERROR_RATE'])
+                for email, username in db.session.query(User.email, User.username).yield_per(10000):
+                    bloom.add(self.email_key(email))
+                    bloom.add(self.username_key(username))
+                state['filter'] = bloom
+        return state['filter']
+
+    # 启动时加载过滤器，fork出的工作进程直接继承；数据表尚未创建时保留到第一次检查再加载
+    def warm_app(self, app):
+        with app.app_context():
+            from . import db
+            try:
+                return self.warm()
+            except SQLAlchemyError as e:
+                logger.warning('Warming the registration filter failed, will load on first use: %s', e)
+                return None
+            finally:
+                db.session.remove()
+
+    @property
+    def filter(self):
+        state = current_app.extensions['taken_names']
+        return state['filter'] if state['filter'] is not None else self.warm()
+
+    # 新增或修改用户时调用；过滤器尚未加载时无需处理，加载时会读取数据库
+    def add(self, email=None, username=None):
+        bloom = current_app.extensions['taken_names']['filter']
+        if bloom is None:
+            return
+        if email:
+            bloom.add(self.email_key(email))
+        if username:
+            bloom.add(self.username_key(username))
+
+    def may_contain_email(self, email):
+        bloom = self.filter
+        return bloom is None or self.email_key(email) in bloom
+
+    def may_contain_username(self, username):
+        bloom = self.filter
+        return bloom is None or self.username_key(username) in bloom
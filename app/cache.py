@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class LRUCache:
+    """带过期时间和容量上限的进程内缓存，超出容量时淘汰最久未使用的条目。"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class UserCache:
+    """Flask-Login用户加载缓存，保存只读的Principal快照。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_USER_CACHE_SIZE', 1024)
+        app.config.setdefault('FLASKY_USER_CACHE_TTL', 60)
+        app.extensions['user_cache'] = LRUCache(app.config['FLASKY_USER_CACHE_SIZE'],
+                                                app.config['FLASKY_USER_CACHE_TTL'])
+
+    @property
+    def cache(self):
+        return current_app.extensions['user_cache']
+
+    def get(self, user_id):
+        return self.cache.get(user_id)
+
+    def set(self, user_id, user):
+        self.cache.set(user_id, user)
+
+    def invalidate(self, user_id=None):
+        # 不传入用户ID时清空全部缓存，用于角色权限变化
+        if user_id is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(user_id)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class ProfileCache:
+    """资料页缓存：按用户及版本缓存渲染结果，并短时间记住不存在的用户名。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PROFILE_CACHE_SIZE', 512)
+        app.config.setdefault('FLASKY_PROFILE_CACHE_TTL', 300)
+        app.config.setdefault('FLASKY_PROFILE_MISSING_TTL', 60)
+        app.extensions['profile_cache'] = {
+            'pages': LRUCache(app.config['FLASKY_PROFILE_CACHE_SIZE'],
+                              app.config['FLASKY_PROFILE_CACHE_TTL']),
+            'missing': LRUCache(app.config['FLASKY_PROFILE_CACHE_SIZE'] * 8,
+                                app.config['FLASKY_PROFILE_MISSING_TTL']),
+        }
+
+    @property
+    def pages(self):
+        return current_app.extensions['profile_cache']['pages']
+
+    @property
+    def missing(self):
+        return current_app.extensions['profile_cache']['missing']
+
+    def get_page(self, key):
+        return self.pages.get(key)
+
+    def set_page(self, key, html):
+        self.pages.set(key, html)
+
+    def is_missing(self, username):
+        return self.missing.get(username, False)
+
+    def set_missing(self, username):
+        self.missing.set(username, True)
+
+    # 新用户注册后清除对应的不存在记录
+    def forget_missing(self, username):
+        self.missing.pop(username)
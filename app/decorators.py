@@ -1,14 +1,31 @@
 from functools import wraps
-from flask import abort
-from flask_login import current_user
+from flask import abort, _request_ctx_stack
+from flask_login import current_user, user_logged_in, user_logged_out
 from .models import Permission
 
 
+def current_permissions():
+    """当前用户的权限位掩码，每个请求只解析一次。"""
+    # 与Flask-Login保存current_user一样放在请求上下文中；g属于应用上下文，可能被多个请求共用
+    ctx = _request_ctx_stack.top
+    permissions = getattr(ctx, 'flasky_permissions', None)
+    if permissions is None:
+        permissions = ctx.flasky_permissions = current_user.permissions
+    return permissions
+
+# 请求中途登录或退出后，权限需要按新的用户重新解析
+@user_logged_in.connect
+@user_logged_out.connect
+def _forget_permissions(sender, user=None, **extra):
+    ctx = _request_ctx_stack.top
+    if ctx is not None:
+        ctx.flasky_permissions = None
+
 def permission_required(permission):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not current_user.can(permission):
+            if current_permissions() & permission != permission:
                 abort(403)
             return f(*args, **kwargs)
         return decorated_function
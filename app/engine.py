@@ -0,0 +1,46 @@
+import sqlite3
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+
+def sqlite_pragmas(config):
+    """根据配置生成每个新连接要执行的PRAGMA，值为None的项不设置。"""
+    pragmas = [
+        ('journal_mode', 'WAL' if config['FLASKY_SQLITE_WAL'] else None),
+        ('synchronous', config['FLASKY_SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['FLASKY_SQLITE_BUSY_TIMEOUT']),
+        ('cache_size', config['FLASKY_SQLITE_CACHE_SIZE']),
+        ('mmap_size', config['FLASKY_SQLITE_MMAP_SIZE']),
+    ]
+    return [(name, value) for name, value in pragmas if value is not None]
+
+
+def sqlite_connection_factory(pragmas):
+    # 作为sqlite3.connect的factory参数，连接建立后立即执行PRAGMA
+    class Connection(sqlite3.Connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            for name, value in pragmas:
+                self.execute('PRAGMA %s = %s' % (name, value))
+    return Connection
+
+
+def configure_engine(app):
+    """把连接池和SQLite PRAGMA配置合并到SQLALCHEMY_ENGINE_OPTIONS中，显式设置的选项优先。"""
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.drivername.startswith('sqlite'):
+        # 内存数据库由Flask-SQLAlchemy使用StaticPool，只有一个连接，不做调整
+        if url.database in (None, '', ':memory:'):
+            return
+        # Flask-SQLAlchemy默认为SQLite文件使用NullPool，每次请求都重新连接
+        options.setdefault('poolclass', QueuePool)
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args.setdefault('check_same_thread', False)
+        connect_args.setdefault('factory', sqlite_connection_factory(sqlite_pragmas(app.config)))
+        options['connect_args'] = connect_args
+    options.setdefault('pool_size', app.config['FLASKY_DB_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['FLASKY_DB_MAX_OVERFLOW'])
+    options.setdefault('pool_recycle', app.config['FLASKY_DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', app.config['FLASKY_DB_POOL_PRE_PING'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
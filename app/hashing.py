@@ -0,0 +1,138 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from .profiling import track_hash
+
+
+class HashingBusy(Exception):
+    """哈希队列已满或等待超时，视图层应返回503。"""
+
+
+class HashPool:
+    """有界进程池，密码哈希在子进程中计算，不占用请求线程的GIL。"""
+
+    def __init__(self, workers, queue_depth, timeout, sync=False):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.sync = sync
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    # 进程池在第一次使用时才创建，避免在预加载阶段产生子进程
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, fn, *args):
+        # 排队的任务数达到上限时立即拒绝，不再堆积请求
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('password hashing queue is full')
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        if self.sync:
+            return fn(*args)
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy('password hashing timed out')
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class PasswordHasher:
+    """Flask扩展形式的入口，User模型通过它生成和校验密码哈希。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        app.config.setdefault('FLASKY_PASSWORD_SALT_LENGTH', 8)
+        app.config.setdefault('FLASKY_HASH_SYNC', False)
+        app.config.setdefault('FLASKY_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('FLASKY_HASH_QUEUE_DEPTH', 0)
+        app.config.setdefault('FLASKY_HASH_TIMEOUT', 5)
+        workers = app.config['FLASKY_HASH_WORKERS']
+        pool = HashPool(workers,
+                        app.config['FLASKY_HASH_QUEUE_DEPTH'] or workers * 4,
+                        app.config['FLASKY_HASH_TIMEOUT'],
+                        sync=app.config['FLASKY_HASH_SYNC'])
+        app.extensions['hasher'] = pool
+        atexit.register(pool.shutdown)
+
+    @property
+    def pool(self):
+        return current_app.extensions['hasher']
+
+    @staticmethod
+    def method():
+        # 补全迭代次数，与哈希字符串中保存的算法参数格式一致
+        method = current_app.config['FLASKY_PASSWORD_HASH_METHOD']
+        if method.startswith('pbkdf2:') and method.count(':') == 1:
+            method = '%s:%d' % (method, DEFAULT_PBKDF2_ITERATIONS)
+        return method
+
+    def hash(self, password):
+        with track_hash():
+            return self.pool.run(generate_password_hash, password, self.method(),
+                                 current_app.config['FLASKY_PASSWORD_SALT_LENGTH'])
+
+    def verify(self, pwhash, password):
+        with track_hash():
+            return self.pool.run(check_password_hash, pwhash, password)
+
+    # 判断已保存的哈希是否使用了过期的算法参数
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method()
+
+    # 登录成功后在后台用当前参数重新计算哈希，只有哈希未被修改时才写回
+    def rehash(self, user_id, old_hash, password):
+        app = current_app._get_current_object()
+        pool = self.pool
+        args = (password, self.method(), app.config['FLASKY_PASSWORD_SALT_LENGTH'])
+        if pool.sync:
+            _store_rehash(app, user_id, old_hash, generate_password_hash(*args))
+            return
+        try:
+            future = pool.submit(generate_password_hash, *args)
+        except HashingBusy:
+            # 队列繁忙时放弃本次升级，下次登录再尝试
+            return
+        future.add_done_callback(
+            lambda f: f.exception() is None and _store_rehash(app, user_id, old_hash, f.result()))
+
+
+def _store_rehash(app, user_id, old_hash, new_hash):
+    from . import db
+    from .models import User
+    users = User.__table__
+    stmt = users.update() \
+        .where(users.c.id == user_id) \
+        .where(users.c.password_hash == old_hash) \
+        .values(password_hash=new_hash, updated_at=users.c.updated_at)
+    with db.get_engine(app).begin() as conn:
+        conn.execute(stmt)
+    # 可能运行在进程池的回调线程中，直接操作应用的缓存对象
+    app.extensions['user_cache'].pop(user_id)
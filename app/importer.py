@@ -0,0 +1,196 @@
+import csv
+import io
+import json
+import re
+import sys
+from datetime import datetime
+from itertools import repeat
+from flask import current_app
+from werkzeug.security import generate_password_hash
+from . import db, hasher, taken_names, profile_cache
+from .models import User, Role
+
+
+USERNAME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_.]*$')
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+
+
+class ImportStats:
+    """导入进度：读取的行数、插入数、已存在而跳过的行数和无效行。"""
+
+    def __init__(self, line=0):
+        self.line = line
+        self.read = 0
+        self.inserted = 0
+        self.existing = 0
+        self.errors = []
+
+    @property
+    def invalid(self):
+        return len(self.errors)
+
+
+def detect_format(filename):
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt='csv'):
+    """逐行读取CSV（首行为列名）或NDJSON，生成(行号, 字典)，不把整个文件读入内存。"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_num, row if isinstance(row, dict) else {}
+
+
+def load_roles():
+    """读取一次角色表，返回(小写角色名到id的映射, 默认角色id)。"""
+    roles = Role.query.all()
+    by_name = {role.name.lower(): role.id for role in roles}
+    default = next((role.id for role in roles if role.default), None)
+    return by_name, default
+
+
+def _hash_many(passwords, method, salt_length):
+    # 在进程池中执行，一个任务计算一组密码，减少进程间通信的次数
+    return [generate_password_hash(p, method, salt_length) if p else None for p in passwords]
+
+
+def hash_passwords(passwords):
+    """用密码哈希进程池计算一批密码的哈希，结果顺序与输入一致。"""
+    pool = hasher.pool
+    method = hasher.method()
+    salt_length = current_app.config['FLASKY_PASSWORD_SALT_LENGTH']
+    size = max(1, current_app.config['FLASKY_IMPORT_HASH_CHUNK'])
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    if pool.sync:
+        results = [_hash_many(chunk, method, salt_length) for chunk in chunks]
+    else:
+        # 导入时不经过请求用的排队上限，直接把整批任务交给进程池
+        results = pool.executor.map(_hash_many, chunks, repeat(method), repeat(salt_length))
+    return [pwhash for chunk in results for pwhash in chunk]
+
+
+def _prepare(row, roles, default_role, admin_role, confirmed):
+    # 校验并转换一行输入，返回要插入的列或错误信息
+    email = (row.get('email') or '').strip()
+    username = (row.get('username') or '').strip()
+    if not EMAIL_RE.match(email) or len(email) > 64:
+        return None, 'invalid email %r' % email
+    if not USERNAME_RE.match(username) or len(username) > 64:
+        return None, 'invalid username %r' % username
+    # 没有密码的账号无法登录，直接拒绝
+    if not row.get('password') and not row.get('password_hash'):
+        return None, 'missing password for %r' % email
+    role_name = (row.get('role') or '').strip().lower()
+    if role_name:
+        if role_name not in roles:
+            return None, 'unknown role %r' % role_name
+        role_id = roles[role_name]
+    elif email == current_app.config['FLASKY_ADMIN'] and admin_role:
+        role_id = admin_role
+    else:
+        role_id = default_role
+    value = row.get('confirmed')
+    if value not in (None, ''):
+        confirmed = value is True or str(value).strip().lower() in TRUE_VALUES
+    return {
+        'email': email, 'email_normalized': User.normalize(email),
+        'username': username, 'username_normalized': User.normalize(username),
+        'role_id': role_id, 'confirmed': confirmed,
+        'name': row.get('name') or None, 'location': row.get('location') or None,
+        'about_me': row.get('about_me') or None,
+        'password_hash': row.get('password_hash') or None,
+        'password': row.get('password') or None,
+    }, None
+
+
+def _existing(values):
+    # 一次查询找出这批用户中已存在的邮箱和用户名，重新运行时据此跳过已导入的行
+    emails = [value['email_normalized'] for value in values]
+    usernames = [value['username_normalized'] for value in values]
+    rows = db.session.query(User.email_normalized, User.username_normalized) \
+        .filter(db.or_(User.email_normalized.in_(emails), User.username_normalized.in_(usernames))).all()
+    return set(row.email_normalized for row in rows), set(row.username_normalized for row in rows)
+
+
+def _insert_batch(batch, stats):
+    emails, usernames = _existing([values for _, values in batch])
+    pending = []
+    for line, values in batch:
+        if values['email_normalized'] in emails or values['username_normalized'] in usernames:
+            stats.existing += 1
+            continue
+        # 同一批中重复的邮箱或用户名只导入第一次出现的行
+        emails.add(values['email_normalized'])
+        usernames.add(values['username_normalized'])
+        pending.append(values)
+    if not pending:
+        return
+    hashes = hash_passwords([values.pop('password') for values in pending])
+    now = datetime.utcnow()
+    for values, pwhash in zip(pending, hashes):
+        values['password_hash'] = values['password_hash'] or pwhash
+        values['member_since'] = values['last_seen'] = values['updated_at'] = now
+    db.session.execute(User.__table__.insert(), pending)
+    db.session.commit()
+    # 批量插入不经过ORM事件，需要手动更新注册预过滤器和资料页的不存在缓存
+    for values in pending:
+        taken_names.add(values['email'], values['username'])
+        profile_cache.forget_missing(values['username_normalized'])
+    stats.inserted += len(pending)
+
+
+def import_users(rows, batch_size=None, start_line=0, confirmed=True, progress=None):
+    """批量导入用户。
+
+    rows为read_rows生成的(行号, 字典)，行号不大于start_line的行直接跳过；每批在一个事务中插入并提交，
+    提交后调用progress(stats)，stats.line为已完成的最后一行，可作为下次运行的start_line。
+    已存在的邮箱或用户名会被跳过，因此中断后重新运行整个文件也是安全的。
+    """
+    batch_size = batch_size or current_app.config['FLASKY_IMPORT_BATCH_SIZE']
+    # 导入期间的查询都读主库，不会因为副本延迟而漏掉刚插入的行
+    db.session().use_primary = True
+    roles, default_role = load_roles()
+    admin_role = roles.get('administrator')
+    stats = ImportStats(start_line)
+    batch = []
+    last_line = start_line
+    for line, row in rows:
+        if line <= start_line:
+            continue
+        stats.read += 1
+        last_line = line
+        values, error = _prepare(row, roles, default_role, admin_role, confirmed)
+        if error:
+            stats.errors.append((line, error))
+        else:
+            batch.append((line, values))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, stats)
+            batch = []
+            stats.line = last_line
+            if progress:
+                progress(stats)
+    if batch:
+        _insert_batch(batch, stats)
+    stats.line = last_line
+    if progress:
+        progress(stats)
+    return stats
+
+
+def open_input(path):
+    # '-'表示标准输入；newline=''是csv模块要求的打开方式
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
@@ -0,0 +1,49 @@
+import importlib
+import threading
+from flask import current_app
+
+
+class LazyExtension:
+    """延迟导入和初始化的扩展。
+
+    FLASKY_LAZY_EXTENSIONS开启时，init_app只做登记，第一次访问扩展的属性时才导入模块并调用
+    真正的init_app；first_request为True时在第一个请求前初始化，用于需要注册模板上下文的扩展。
+    未开启时与直接使用扩展相同。
+    """
+
+    def __init__(self, import_name, name, first_request=False):
+        self.import_name = import_name
+        self.name = name
+        self.first_request = first_request
+        self._instance = None
+        self._lock = threading.RLock()
+
+    @property
+    def instance(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    module, cls = self.import_name.split(':')
+                    self._instance = getattr(importlib.import_module(module), cls)()
+        return self._instance
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_LAZY_EXTENSIONS', False)
+        if not app.config['FLASKY_LAZY_EXTENSIONS']:
+            self.instance.init_app(app)
+        elif self.first_request:
+            app.before_first_request(lambda: self.ensure(app))
+
+    def ensure(self, app):
+        """确保扩展已在app上初始化。"""
+        if self.name not in app.extensions:
+            with self._lock:
+                if self.name not in app.extensions:
+                    self.instance.init_app(app)
+
+    def __getattr__(self, attr):
+        # 只有实例上没有的属性才会走到这里，即扩展自身的方法和属性
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        self.ensure(current_app._get_current_object())
+        return getattr(self.instance, attr)
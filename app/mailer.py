@@ -0,0 +1,143 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def close_connection(conn):
+    if conn is not None:
+        try:
+            conn.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+    return None
+
+
+def _is_connection_error(e):
+    # SMTPException是OSError的子类；SMTP服务器拒绝单封邮件时连接仍然可用，不需要重连
+    return isinstance(e, smtplib.SMTPServerDisconnected) or \
+        (isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException))
+
+
+def deliver(mail, conn, messages, retries=3, backoff=1.0, on_result=None):
+    """在同一条连接上依次发送messages，返回仍可复用的连接（可能为None）。
+
+    连接断开或无法建立时重新连接并按指数退避重试当前邮件，重试用尽后放弃剩余的邮件；
+    单封邮件被拒收或内容有误时只丢弃这一封，继续发送后面的邮件。
+    每封邮件处理完后调用on_result(index, error)，发送成功时error为None。
+    """
+    attempt = 0
+    index = 0
+    while index < len(messages):
+        connecting = conn is None
+        try:
+            if connecting:
+                conn = mail.connect().__enter__()
+                connecting = False
+            conn.send(messages[index])
+        except Exception as e:
+            if not connecting and not _is_connection_error(e):
+                logger.exception('Dropping message to %s', ', '.join(messages[index].send_to or ()) or '(none)')
+                error = e
+            else:
+                conn = None if connecting else close_connection(conn)
+                attempt += 1
+                if attempt <= retries:
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                    continue
+                logger.exception('Dropping %d message(s) after %d retries', len(messages) - index, retries)
+                if on_result:
+                    for i in range(index, len(messages)):
+                        on_result(i, e)
+                return None
+        else:
+            error = None
+            attempt = 0
+        if on_result:
+            on_result(index, error)
+        index += 1
+    return conn
+
+
+_STOP = object()
+
+
+class MailDispatcher:
+    """固定数量的发送线程共享一个有界队列，每个线程复用一条SMTP连接连续发送多封邮件。
+
+    队列已满时send阻塞，调用方（outbox发送进程）随之放慢认领速度；shutdown先发送完队列中的邮件再退出。
+    """
+
+    def __init__(self, app, workers=2, queue_size=100, retries=3, backoff=1.0, idle_timeout=10):
+        self.app = app
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    # 发送线程在第一封邮件入队时才启动
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thr = threading.Thread(target=self._run, name='mail-worker-%d' % i, daemon=True)
+                thr.start()
+                self._threads.append(thr)
+
+    def send(self, msg, callback=None):
+        """放入发送队列；发送完成或放弃后在发送线程中调用callback(error)，成功时error为None。"""
+        self.start()
+        self._queue.put((msg, callback))
+
+    # 等待队列中已有的邮件全部发送完成
+    def join(self):
+        self._queue.join()
+
+    # 发送完队列中剩余的邮件后停止所有线程
+    def shutdown(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thr in threads:
+            thr.join()
+
+    def _run(self):
+        from . import mail
+        conn = None
+        with self.app.app_context():
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout if conn else None)
+                except queue.Empty:
+                    # 空闲超时，关闭连接
+                    conn = close_connection(conn)
+                    continue
+                if item is _STOP:
+                    self._queue.task_done()
+                    close_connection(conn)
+                    return
+                msg, callback = item
+                try:
+                    conn = deliver(mail, conn, [msg], self.retries, self.backoff,
+                                   lambda index, error: _notify(callback, error))
+                finally:
+                    self._queue.task_done()
+
+
+def _notify(callback, error):
+    # 回调出错不能让发送线程退出
+    if callback is None:
+        return
+    try:
+        callback(error)
+    except Exception:
+        logger.exception('Mail callback failed')
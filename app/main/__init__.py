@@ -1,4 +1,5 @@
 from flask import Blueprint
+from ..models import Permission
 
 # 实例化蓝本，传入蓝本所在的包以及蓝本的名称
 main = Blueprint('main', __name__)
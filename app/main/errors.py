@@ -1,5 +1,6 @@
 from flask import render_template
 from . import main
+from ..hashing import HashingBusy
 
 
 # app_errorhandler装饰器作用于全局。
@@ -9,4 +10,9 @@ def page_not_found(e) -> 'html':
 
 @main.app_errorhandler(500)
 def internal_server_error(e) -> 'html':
-    return render_template('500.html'), 500
\ No newline at end of file
+    return render_template('500.html'), 500
+
+# 密码哈希队列已满时快速返回503，而不是让请求排队等待
+@main.app_errorhandler(HashingBusy)
+def service_unavailable(e) -> 'html':
+    return render_template('503.html'), 503
@@ -1,12 +1,68 @@
-from flask import render_template
+import hashlib
+from flask import render_template, request, session, abort, make_response, current_app
+from flask_login import current_user
 from . import main
+from .. import db, profile_cache
+from ..models import User
+from ..querybudget import query_budget
+from ..search import search_users
 
 
 @main.route('/')
+@query_budget(1)
 def index():
     return render_template('index.html')
 
+# 判断条件请求是否命中，If-None-Match优先于If-Modified-Since
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified is not None \
+        and last_modified.replace(microsecond=0) <= since
+
 @main.route('/user/<username>')
+@query_budget(3)
 def user(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    return render_template('user.html', user=user)
\ No newline at end of file
+    key = User.normalize(username)
+    # 最近确认不存在的用户名直接返回404，不访问数据库
+    if profile_cache.is_missing(key):
+        abort(404)
+    row = db.session.query(User.id, User.updated_at, User.last_seen) \
+        .filter(User.username_normalized == key).first()
+    if row is None:
+        profile_cache.set_missing(key)
+        abort(404)
+    # 页面内容还取决于浏览者（导航栏、管理员可见的邮箱），一并计入ETag
+    viewer = '%s:%d' % (current_user.get_id() or '-', current_user.is_administrator())
+    etag = hashlib.sha1(('%d:%s:%s:%s' % (row.id, row.updated_at, row.last_seen, viewer))
+                        .encode('utf-8')).hexdigest()
+    last_modified = max(filter(None, (row.updated_at, row.last_seen)), default=None)
+    # 有待显示的闪现消息时页面不可复用
+    cacheable = not session.get('_flashes')
+    if cacheable and _not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        html = profile_cache.get_page(etag) if cacheable else None
+        if html is None:
+            html = render_template('user.html', user=User.query.get(row.id))
+            if cacheable:
+                profile_cache.set_page(etag, html)
+        response = make_response(html)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# 用户搜索，按相关度排序分页；页数有上限，避免深分页扫描大量匹配结果
+@main.route('/search')
+@query_budget(2)
+def search():
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    if page < 1 or page > current_app.config['FLASKY_SEARCH_MAX_PAGE']:
+        abort(404)
+    users, has_next = search_users(q, page, current_app.config['FLASKY_SEARCH_PER_PAGE'])
+    return render_template('search.html', q=q, users=users, page=page, has_next=has_next)
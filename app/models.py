@@ -1,9 +1,9 @@
-from . import db, login_manager
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime
+from . import db, login_manager, presence, user_cache, profile_cache, hasher, tokens, taken_names
 from flask_login import UserMixin, AnonymousUserMixin
-# 生成令牌字符串库
-from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from flask import current_app
+from flask import current_app, has_app_context
+from sqlalchemy import event, or_
+from sqlalchemy.orm import validates
 
 
 # 定义权限类
@@ -85,15 +85,20 @@ class User(db.Model, UserMixin):
     # index，为列创建索引，提高查询效率
     username = db.Column(db.String(64), unique=True, index=True)
     email = db.Column(db.String(64), unique=True, index=True)
+    # 去除首尾空白并转为小写的邮箱和用户名，所有查找都通过这两列的索引
+    username_normalized = db.Column(db.String(64), unique=True, index=True)
+    email_normalized = db.Column(db.String(64), unique=True, index=True)
     # 建立外键，值为roles表的id列
-    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
+    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), index=True)
     password_hash = db.Column(db.String(128))
     confirmed = db.Column(db.Boolean, default=False)
     name = db.Column(db.String(64))
     location = db.Column(db.String(64))
     about_me = db.Column(db.Text())
-    member_since = db.Column(db.DateTime(), default=datetime.utcnow)
+    member_since = db.Column(db.DateTime(), default=datetime.utcnow, index=True)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
+    # 资料修改时间，与last_seen一起决定资料页的ETag
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -103,34 +108,61 @@ class User(db.Model, UserMixin):
             if self.role is None:
                 self.role = Role.query.filter_by(default=True).first()
 
+    @staticmethod
+    def normalize(value):
+        return value.strip().lower() if value else value
+
+    # 设置邮箱或用户名时同步更新规范化的列
+    @validates('email')
+    def _set_email_normalized(self, key, value):
+        self.email_normalized = User.normalize(value)
+        return value
+
+    @validates('username')
+    def _set_username_normalized(self, key, value):
+        self.username_normalized = User.normalize(value)
+        return value
+
+    # 不区分大小写按邮箱或用户名查找，返回查询对象
+    @staticmethod
+    def lookup_email(email):
+        return User.query.filter_by(email_normalized=User.normalize(email))
+
+    @staticmethod
+    def lookup_username(username):
+        return User.query.filter_by(username_normalized=User.normalize(username))
+
     # 装饰器将函数属性化,不允许读取password
     @property
     def password(self):
         raise AttributeError('password is not a readable attribute')
 
-    # 只写属性
+    # 只写属性，哈希计算交给进程池
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
-    # 比对密码与加密
+    # 比对密码与加密，参数过期的哈希在校验成功后于后台升级
     def verify_password(self, password) -> bool:
-        return check_password_hash(self.password_hash, password)
+        if self.password_hash is None:
+            return False
+        if not hasher.verify(self.password_hash, password):
+            return False
+        if self.id is not None and hasher.needs_rehash(self.password_hash):
+            hasher.rehash(self.id, self.password_hash, password)
+        return True
 
     # 生成令牌，默认有效期十五分钟
     def generate_confirmation_token(self, expiration=900) -> 'token':
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'confirm': self.id}).decode('utf-8')
+        return tokens.dumps('confirm', {'confirm': self.id}, expiration)
 
-    # 验证令牌
+    # 验证令牌，每个令牌只能使用一次
     def confirm(self, token) -> bool:
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token.encode('utf-8'))
-        except:
-            return False
+        data = tokens.loads('confirm', token)
         # 检查令牌中的用户ID与当前登录用户ID是否一致
-        if data.get('confirm') != self.id:
+        if data is None or data.get('confirm') != self.id:
+            return False
+        if not tokens.consume('confirm', token):
             return False
         self.confirmed = True
         db.session.add(self)
@@ -138,19 +170,16 @@ class User(db.Model, UserMixin):
 
     # 生成重置密码的令牌
     def generate_reset_token(self, expiration=900) -> 'token':
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'reset': self.id}).decode('utf-8')
+        return tokens.dumps('reset', {'reset': self.id}, expiration)
 
     # 验证令牌
     @staticmethod
     def reset_password(token, new_password) -> bool:
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token.encode('utf-8'))
-        except:
+        data = tokens.loads('reset', token)
+        if data is None:
             return False
         user = User.query.get(data.get('reset'))
-        if user is None:
+        if user is None or not tokens.consume('reset', token):
             return False
         user.password = new_password
         db.session.add(user)
@@ -158,40 +187,89 @@ class User(db.Model, UserMixin):
 
     # 生成更换邮箱的令牌
     def generate_change_email_token(self, new_email, expiration=900) -> 'token':
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'change': self.id, 'new_email': new_email}).decode('utf-8')
+        return tokens.dumps('change_email', {'change': self.id, 'new_email': new_email}, expiration)
     
     # 验证令牌
     def change_email_confirm(self, token) -> bool:
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token.encode('utf-8'))
-        except:
-            return False
+        data = tokens.loads('change_email', token)
         # 检查令牌中的用户ID与当前登录用户ID是否一致
-        if data.get('change') != self.id:
+        if data is None or data.get('change') != self.id:
+            return False
+        if not tokens.consume('change_email', token):
             return False
         self.email = data.get('new_email')
         db.session.add(self)
         return True
 
+    # 一次查询同时检查邮箱和用户名是否已被注册，返回(邮箱已注册, 用户名已注册)
+    # 预过滤器判定两者都不存在时不访问数据库
+    @staticmethod
+    def taken(email, username):
+        check_email = bool(email) and taken_names.may_contain_email(email)
+        check_username = bool(username) and taken_names.may_contain_username(username)
+        email, username = User.normalize(email), User.normalize(username)
+        conditions = []
+        if check_email:
+            conditions.append(User.email_normalized == email)
+        if check_username:
+            conditions.append(User.username_normalized == username)
+        if not conditions:
+            return False, False
+        rows = db.session.query(User.email_normalized, User.username_normalized) \
+            .filter(or_(*conditions)).all()
+        return (check_email and any(row.email_normalized == email for row in rows),
+                check_username and any(row.username_normalized == username for row in rows))
+
+    # 角色的权限位掩码，没有角色时为0
+    @property
+    def permissions(self):
+        return (self.role.permissions or 0) if self.role is not None else 0
+
     def can(self, perm):
-        return self.role is not None and self.role.has_permission(perm)
+        return self.permissions & perm == perm
 
     def is_administrator(self):
         return self.can(Permission.ADMIN)
 
-    # 更新用户最后访问时间
+    # 更新用户最后访问时间，默认写入缓冲区由后台批量提交
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
-        db.session.commit()
+        if current_app.config['FLASKY_LAST_SEEN_SYNC']:
+            self.last_seen = datetime.utcnow()
+            # 访问时间不算资料修改，保持updated_at不变
+            self.updated_at = User.__table__.c.updated_at
+            db.session.add(self)
+            db.session.commit()
+        else:
+            presence.record(self.id)
 
     def __repr__(self):
         # 返回具有可读性的字符串表示模型，供测试调试使用，非必须
         return '<User %r>' % self.username
 
+# 定义数据库表outbox模型，待发送的邮件与业务数据在同一事务中写入
+class Outbox(db.Model):
+    __tablename__ = 'outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(64))
+    subject = db.Column(db.String(128))
+    template = db.Column(db.String(128))
+    # 模板参数，JSON格式
+    context = db.Column(db.Text())
+    # pending、sending、sent或failed
+    status = db.Column(db.String(16), default='pending', index=True)
+    attempts = db.Column(db.Integer, default=0)
+    claim_token = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.DateTime())
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime())
+    last_error = db.Column(db.Text())
+
+    def __repr__(self):
+        return '<Outbox %r %r>' % (self.id, self.status)
+
 class AnonymousUser(AnonymousUserMixin):
+    permissions = 0
+
     def can(self, permissions):
         return False
 
@@ -200,6 +278,94 @@ class AnonymousUser(AnonymousUserMixin):
 
 login_manager.anonymous_user = AnonymousUser
 
+class Principal:
+    """请求中current_user使用的只读用户快照，只包含权限判断和模板需要的字段。
+
+    permissions是加载时从角色复制的位掩码，角色权限修改提交后用户缓存整体失效，
+    下次请求重新加载。需要修改账户的视图通过user属性加载完整的User对象。
+    """
+
+    __slots__ = ('id', 'username', 'confirmed', 'permissions')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, confirmed, permissions):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'username', username)
+        object.__setattr__(self, 'confirmed', bool(confirmed))
+        object.__setattr__(self, 'permissions', permissions or 0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Principal is read-only, modify current_user.user instead')
+
+    def get_id(self):
+        return str(self.id)
+
+    def can(self, perm):
+        return self.permissions & perm == perm
+
+    def is_administrator(self):
+        return self.can(Permission.ADMIN)
+
+    # 同一会话中重复访问时从标识映射中取出，不会再次查询
+    @property
+    def user(self):
+        return User.query.get(self.id)
+
+    def ping(self):
+        if current_app.config['FLASKY_LAST_SEEN_SYNC']:
+            self.user.ping()
+        else:
+            presence.record(self.id)
+
+    def __repr__(self):
+        return '<Principal %r>' % self.username
+
+# 用户加载器先查缓存，未命中时只查询Principal需要的列
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    principal = user_cache.get(user_id)
+    if principal is None:
+        row = db.session.query(User.id, User.username, User.confirmed, Role.permissions) \
+            .outerjoin(Role, User.role_id == Role.id).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        principal = Principal(*row)
+        user_cache.set(user_id, principal)
+    return principal
+
+# 新增用户或修改邮箱后更新注册预过滤器
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _update_taken_names(mapper, connection, target):
+    if has_app_context():
+        taken_names.add(target.email, target.username)
+        profile_cache.forget_missing(target.username_normalized)
+
+# flush时记录被修改的用户和角色，提交成功后再使缓存失效
+@event.listens_for(db.session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    changed = session.info.setdefault('changed_users', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, Role):
+            changed.add(None)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_user_cache(session):
+    changed = session.info.pop('changed_users', None)
+    if not changed or not has_app_context():
+        return
+    if None in changed:
+        user_cache.invalidate()
+    else:
+        for user_id in changed:
+            user_cache.invalidate(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop('changed_users', None)
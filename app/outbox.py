@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, and_
+from . import db, mail
+from .email import render_email
+from .mailer import deliver, close_connection
+from .models import Outbox, User, Principal
+
+
+logger = logging.getLogger(__name__)
+
+
+# 模板参数中的用户对象只保存ID，发送时再重新加载
+def _dump_context(kwargs):
+    context = {}
+    for key, value in kwargs.items():
+        # current_user等代理对象先取出实际的用户对象
+        if hasattr(value, '_get_current_object'):
+            value = value._get_current_object()
+        if isinstance(value, (User, Principal)):
+            value = {'__user__': value.id}
+        context[key] = value
+    return json.dumps(context)
+
+
+def _load_context(context):
+    kwargs = json.loads(context or '{}')
+    for key, value in kwargs.items():
+        if isinstance(value, dict) and '__user__' in value:
+            kwargs[key] = User.query.get(value['__user__'])
+    return kwargs
+
+
+def queue_email(to, subject, template, **kwargs):
+    """把邮件写入outbox表，由调用方在同一事务中提交。"""
+    entry = Outbox(recipient=to, subject=subject, template=template,
+                   context=_dump_context(kwargs))
+    db.session.add(entry)
+    return entry
+
+
+# 认领一批待发送的记录；超过租约时间仍未完成的记录视为发送进程已退出，重新认领
+def claim_batch(batch_size=100, lease=300):
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    expired = now - timedelta(seconds=lease)
+    ids = db.session.query(Outbox.id) \
+        .filter(or_(Outbox.status == 'pending',
+                    and_(Outbox.status == 'sending', Outbox.claimed_at < expired))) \
+        .order_by(Outbox.id).limit(batch_size)
+    Outbox.query.filter(Outbox.id.in_(ids.subquery())) \
+        .update({'status': 'sending', 'claim_token': token, 'claimed_at': now},
+                synchronize_session=False)
+    db.session.commit()
+    return Outbox.query.filter_by(claim_token=token, status='sending') \
+        .order_by(Outbox.id).all()
+
+
+def check_base_url(app):
+    """邮件中的链接在发送进程中渲染，没有真实请求，必须配置站点地址，否则链接会指向localhost。"""
+    if not app.config.get('FLASKY_BASE_URL') and not app.config.get('SERVER_NAME'):
+        raise RuntimeError('Set FLASKY_BASE_URL (or SERVER_NAME) so links in emails point at the site')
+
+
+def _render(entry):
+    app = current_app._get_current_object()
+    kwargs = _load_context(entry.context)
+    # 邮件中的链接需要完整URL，在模拟的请求上下文中渲染；未设置FLASKY_BASE_URL时使用SERVER_NAME
+    with app.test_request_context(base_url=app.config.get('FLASKY_BASE_URL')):
+        return render_email(entry.recipient, entry.subject, entry.template, **kwargs)
+
+
+def prepare_batch(entries, max_attempts=5):
+    """增加尝试次数并渲染邮件，渲染失败的记录直接标记，返回[(记录id, 尝试次数, 邮件)]。"""
+    ready = []
+    for entry in entries:
+        entry.attempts = (entry.attempts or 0) + 1
+        try:
+            ready.append((entry.id, entry.attempts, _render(entry)))
+        except Exception as e:
+            logger.warning('Rendering outbox entry %d failed: %s', entry.id, e)
+            entry.last_error = str(e)
+            entry.status = 'failed' if entry.attempts >= max_attempts else 'pending'
+    db.session.commit()
+    return ready
+
+
+def record_result(entry_id, attempts, error, max_attempts=5):
+    """记录一封邮件的发送结果；可能在发送线程中调用，每个线程使用自己的会话。"""
+    if error is None:
+        values = {'status': 'sent', 'sent_at': datetime.utcnow()}
+    else:
+        logger.warning('Sending outbox entry %d failed: %s', entry_id, error)
+        values = {'status': 'failed' if attempts >= max_attempts else 'pending', 'last_error': str(error)}
+    outbox = Outbox.__table__
+    db.session.execute(outbox.update()
+                       .where(outbox.c.id == entry_id)
+                       .where(outbox.c.status == 'sending')
+                       .values(**values))
+    db.session.commit()
+
+
+def process_outbox(batch_size=100, max_attempts=5, lease=300, dispatcher=None):
+    """认领并发送一批outbox中的邮件。
+
+    指定dispatcher时把邮件放入它的发送队列（队列已满时阻塞），返回放入队列的数量；
+    否则在当前线程中共用一条SMTP连接同步发送，返回成功发送的数量。
+    连接断开时按FLASKY_MAIL_RETRIES和FLASKY_MAIL_BACKOFF重连；单封邮件失败只影响这一条记录。
+    """
+    check_base_url(current_app)
+    entries = claim_batch(batch_size, lease)
+    if not entries:
+        return 0
+    ready = prepare_batch(entries, max_attempts)
+    if dispatcher is not None:
+        for entry_id, attempts, msg in ready:
+            dispatcher.send(msg, lambda error, entry_id=entry_id, attempts=attempts:
+                            record_result(entry_id, attempts, error, max_attempts))
+        return len(ready)
+    sent = []
+
+    def on_result(index, error):
+        entry_id, attempts, _ = ready[index]
+        record_result(entry_id, attempts, error, max_attempts)
+        if error is None:
+            sent.append(entry_id)
+
+    app = current_app._get_current_object()
+    conn = deliver(mail, None, [msg for _, _, msg in ready], app.config['FLASKY_MAIL_RETRIES'],
+                   app.config['FLASKY_MAIL_BACKOFF'], on_result)
+    close_connection(conn)
+    return len(sent)
+
+
+def run_worker(dispatcher, batch_size=100, interval=5.0, stop=None, echo=None):
+    """持续认领outbox中的邮件交给dispatcher发送，直到stop被设置。
+
+    退出前等待已认领的邮件全部发送完成，记录不会停留在sending状态直到租约过期。
+    """
+    stop = stop or threading.Event()
+    try:
+        while not stop.is_set():
+            queued = process_outbox(batch_size, dispatcher=dispatcher)
+            if queued and echo:
+                echo('Queued %d email(s).' % queued)
+            if not queued:
+                stop.wait(interval)
+    finally:
+        dispatcher.shutdown()
@@ -0,0 +1,131 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.exc import SQLAlchemyError
+
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceBuffer:
+    """缓存用户最后访问时间，由后台线程按时间间隔或批量大小合并写入数据库。"""
+
+    def __init__(self, app, flush_interval=30, batch_size=500):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    # 后台线程在第一次记录时才启动；fork出的工作进程中父进程的线程已不存在，会重新启动
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='presence-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self.flush()
+            except SQLAlchemyError:
+                logger.exception('Flushing last_seen updates failed, will retry')
+
+    # 记录一次访问，同一用户的多次访问只保留最新时间；写入数据库不在请求中进行
+    def record(self, user_id, when=None):
+        with self._lock:
+            self._pending[user_id] = when or datetime.utcnow()
+            due = len(self._pending) >= self.batch_size
+            self._ensure_thread()
+        if due:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    # 取出缓冲区内的全部记录，用一条批量UPDATE写入；失败时放回缓冲区，等待下次写入
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        from . import db
+        from .models import User
+        users = User.__table__
+        # updated_at只表示资料修改时间，显式保持原值，不触发onupdate
+        stmt = users.update().where(users.c.id == bindparam('uid')) \
+            .values(last_seen=bindparam('seen'), updated_at=users.c.updated_at)
+        params = [{'uid': uid, 'seen': seen} for uid, seen in pending.items()]
+        try:
+            # 直接使用引擎连接，不影响当前请求的会话事务
+            with db.get_engine(self.app).begin() as conn:
+                conn.execute(stmt, params)
+        except SQLAlchemyError:
+            with self._lock:
+                for uid, seen in pending.items():
+                    # 期间又有新的访问时保留较新的时间
+                    if uid not in self._pending or self._pending[uid] < seen:
+                        self._pending[uid] = seen
+            raise
+        return len(params)
+
+    # 停止后台线程，并等待正在进行的写入完成
+    def stop(self, timeout=5):
+        self._stopped = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def flush_at_exit(self):
+        self.stop()
+        try:
+            self.flush()
+        except SQLAlchemyError:
+            logger.exception('Flushing last_seen updates at exit failed')
+
+
+class Presence:
+    """Flask扩展形式的入口，每个应用实例拥有独立的缓冲区。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_LAST_SEEN_SYNC', False)
+        app.config.setdefault('FLASKY_LAST_SEEN_FLUSH_INTERVAL', 30)
+        app.config.setdefault('FLASKY_LAST_SEEN_BATCH_SIZE', 500)
+        previous = app.extensions.get('presence')
+        if previous is not None:
+            previous.stop()
+        buffer = PresenceBuffer(app,
+                                flush_interval=app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL'],
+                                batch_size=app.config['FLASKY_LAST_SEEN_BATCH_SIZE'])
+        app.extensions['presence'] = buffer
+        # 进程退出前写入缓冲区中剩余的记录，内存数据库随进程消失，无需写入
+        if app.config.get('SQLALCHEMY_DATABASE_URI') not in ('sqlite://', 'sqlite:///:memory:'):
+            atexit.register(buffer.flush_at_exit)
+
+    @property
+    def buffer(self):
+        return current_app.extensions['presence']
+
+    def record(self, user_id, when=None):
+        self.buffer.record(user_id, when)
+
+    def pending(self):
+        return self.buffer.pending()
+
+    def flush(self):
+        return self.buffer.flush()
@@ -0,0 +1,184 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# 直方图的桶上限，单位毫秒
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTiming:
+    """单个请求内累计的耗时，单位毫秒。"""
+
+    __slots__ = ('start', 'queries', 'sql', 'slowest', 'render', 'hash', '_query_start', '_render_start')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.slowest = 0.0
+        self.render = 0.0
+        self.hash = 0.0
+        self._query_start = None
+        self._render_start = None
+
+    def server_timing(self, total):
+        return ', '.join([
+            'sql;dur=%.2f;desc="%d queries, slowest %.2fms"' % (self.sql, self.queries, self.slowest),
+            'render;dur=%.2f' % self.render,
+            'hash;dur=%.2f' % self.hash,
+            'total;dur=%.2f' % total,
+        ])
+
+
+class Metrics:
+    """按端点汇总的直方图，以Prometheus文本格式输出。"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, timing, total):
+        with self._lock:
+            for name, value in (('request', total), ('sql', timing.sql),
+                                ('render', timing.render), ('hash', timing.hash)):
+                key = (name, endpoint)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram()
+                self._histograms[key].observe(value)
+            self._queries[endpoint] = self._queries.get(endpoint, 0) + timing.queries
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for (name, endpoint), hist in sorted(self._histograms.items()):
+                metric = 'flasky_%s_duration_ms' % name
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket{endpoint="%s",le="%s"} %d' % (metric, endpoint, le, cumulative))
+                lines.append('%s_sum{endpoint="%s"} %.3f' % (metric, endpoint, hist.sum))
+                lines.append('%s_count{endpoint="%s"} %d' % (metric, endpoint, hist.count))
+            for endpoint, count in sorted(self._queries.items()):
+                lines.append('flasky_sql_queries_total{endpoint="%s"} %d' % (endpoint, count))
+        stats = current_app.extensions['user_cache'].stats()
+        for name in ('hits', 'misses', 'evictions', 'size'):
+            lines.append('flasky_user_cache_%s %d' % (name, stats[name]))
+        return '\n'.join(lines) + '\n'
+
+
+def _timing():
+    if has_request_context():
+        return g.get('_flasky_timing')
+    return None
+
+
+_engine_hooks_installed = False
+
+
+# SQL计时监听器对所有引擎生效，只在开启了分析的请求中记录
+def _install_engine_hooks():
+    global _engine_hooks_installed
+    if _engine_hooks_installed:
+        return
+    _engine_hooks_installed = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timing = _timing()
+        if timing is not None:
+            timing._query_start = time.perf_counter()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timing = _timing()
+        if timing is not None and timing._query_start is not None:
+            elapsed = (time.perf_counter() - timing._query_start) * 1000
+            timing._query_start = None
+            timing.queries += 1
+            timing.sql += elapsed
+            timing.slowest = max(timing.slowest, elapsed)
+
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        timing._render_start = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing._render_start is not None:
+        timing.render += (time.perf_counter() - timing._render_start) * 1000
+        timing._render_start = None
+
+
+@contextmanager
+def track_hash():
+    """统计代码块的哈希耗时；未开启分析时只有一次属性查找的开销。"""
+    timing = _timing()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.hash += (time.perf_counter() - start) * 1000
+
+
+class Profiler:
+    """请求级性能分析：SQL次数与耗时、模板渲染和密码哈希耗时，输出Server-Timing头和/metrics。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PROFILING', False)
+        app.config.setdefault('FLASKY_METRICS_URL', '/metrics')
+        # 关闭时不注册任何钩子
+        if not app.config['FLASKY_PROFILING']:
+            return
+        metrics = Metrics()
+        app.extensions['profiler'] = metrics
+        _install_engine_hooks()
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+
+        @app.before_request
+        def _start_timing():
+            g._flasky_timing = RequestTiming()
+
+        @app.after_request
+        def _finish_timing(response):
+            timing = g.pop('_flasky_timing', None)
+            if timing is None:
+                return response
+            total = (time.perf_counter() - timing.start) * 1000
+            response.headers['Server-Timing'] = timing.server_timing(total)
+            metrics.record(request.endpoint or 'unknown', timing, total)
+            return response
+
+        if app.config['FLASKY_METRICS_URL']:
+            app.add_url_rule(app.config['FLASKY_METRICS_URL'], 'metrics',
+                             lambda: (metrics.render(), 200,
+                                      {'Content-Type': 'text/plain; version=0.0.4'}))
@@ -0,0 +1,86 @@
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event
+
+
+def query_budget(limit):
+    """声明视图每个请求允许执行的SQL语句数，放在路由装饰器下方。"""
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+_SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryCapture:
+    """记录代码块内通过db.engine执行的全部SQL语句。"""
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # 测试基类为每个测试建立的SAVEPOINT不计入预算
+        if statement.startswith(_SAVEPOINT_STATEMENTS):
+            return
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        if self.engine is None:
+            from . import db
+            self.engine = db.get_engine(current_app._get_current_object())
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    # 相同的SQL（参数可不同）执行超过limit次，通常是N+1查询
+    def repeated(self, limit=1):
+        counts = Counter(statement for statement, _ in self.statements)
+        return {statement: n for statement, n in counts.items() if n > limit}
+
+    def report(self):
+        return '\n'.join('  %s %r' % (statement, parameters) for statement, parameters in self.statements)
+
+
+def endpoint_budget(app, path, method='GET'):
+    endpoint, _ = app.url_map.bind('localhost').match(path, method)
+    return endpoint, getattr(app.view_functions[endpoint], 'query_budget', None)
+
+
+def check_budget(capture, endpoint, budget, repeat_limit=1):
+    if budget is not None and capture.count > budget:
+        raise QueryBudgetExceeded('%s issued %d queries, budget is %d:\n%s'
+                                  % (endpoint, capture.count, budget, capture.report()))
+    repeated = capture.repeated(repeat_limit)
+    if repeated:
+        raise QueryBudgetExceeded('%s repeated statements (possible N+1):\n%s'
+                                  % (endpoint, '\n'.join('  %dx %s' % (n, s) for s, n in repeated.items())))
+
+
+class QueryBudgetMixin:
+    """测试用例混入类，发起请求并检查视图声明的查询预算和重复语句。"""
+
+    def assertQueryBudget(self, method, path, repeat_limit=1, **kwargs):
+        from . import db
+        endpoint, budget = endpoint_budget(self.app, path.split('?')[0], method)
+        # 与生产环境一致，请求从空的会话开始
+        db.session.expunge_all()
+        with QueryCapture() as capture:
+            response = self.client.open(path, method=method, **kwargs)
+        try:
+            check_budget(capture, endpoint, budget, repeat_limit)
+        except QueryBudgetExceeded as e:
+            self.fail(str(e))
+        return response
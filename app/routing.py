@@ -0,0 +1,75 @@
+import os
+import random
+import sqlite3
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.expression import SelectBase
+
+
+def configure_replicas(app):
+    """把FLASKY_DB_REPLICA_URLS注册为replica0、replica1……绑定，并记录可用于读取的绑定名。"""
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    keys = []
+    for i, url in enumerate(app.config.get('FLASKY_DB_REPLICA_URLS') or []):
+        key = 'replica%d' % i
+        binds.setdefault(key, url)
+        keys.append(key)
+    if keys:
+        app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['FLASKY_DB_REPLICA_BINDS'] = keys
+
+
+class RoutingSession(SignallingSession):
+    """读写分离的会话：SELECT发往随机一个从库，写入和flush发往主库。
+
+    会话中发生过写入后，之后的读取也使用主库，避免读不到刚写入的数据。
+    会话在请求结束时移除，所以这一状态只在当前请求内有效。
+    """
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self.db = db
+        self.use_primary = False
+
+    def get_bind(self, mapper=None, clause=None):
+        replicas = self.app.config.get('FLASKY_DB_REPLICA_BINDS')
+        if not replicas:
+            return super().get_bind(mapper, clause)
+        # 通过__bind_key__指定了数据库的模型不参与路由
+        if mapper is not None and mapper.persist_selectable.info.get('bind_key'):
+            return super().get_bind(mapper, clause)
+        if self._flushing or not isinstance(clause, SelectBase):
+            self.use_primary = True
+        if self.use_primary:
+            return super().get_bind(mapper, clause)
+        return self.db.get_engine(self.app, bind=random.choice(replicas))
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def _sqlite_path(app, url):
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        raise ValueError('Replica sync only supports SQLite files, got %s' % url)
+    # 与Flask-SQLAlchemy一致，相对路径基于应用根目录
+    return os.path.join(app.root_path, url.database)
+
+
+def sync_replicas(app):
+    """用SQLite在线备份把主库完整复制到每个从库，在本地代替真正的复制。返回已同步的绑定名。"""
+    primary = _sqlite_path(app, app.config['SQLALCHEMY_DATABASE_URI'])
+    synced = []
+    for key in app.config.get('FLASKY_DB_REPLICA_BINDS') or []:
+        source = sqlite3.connect(primary)
+        target = sqlite3.connect(_sqlite_path(app, app.config['SQLALCHEMY_BINDS'][key]))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        synced.append(key)
+    return synced
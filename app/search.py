@@ -0,0 +1,98 @@
+import re
+import time
+from flask import current_app
+from sqlalchemy import DDL, event, or_, text
+from . import db
+from .models import User
+
+
+# 外部内容FTS5表，只保存索引，内容从users表读取；触发器保证批量写入（如导入、迁移）时索引也同步更新
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "username, name, location, about_me, content='users', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, username, name, location, about_me) "
+    "VALUES (new.id, new.username, new.name, new.location, new.about_me); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, username, name, location, about_me) "
+    "VALUES ('delete', old.id, old.username, old.name, old.location, old.about_me); END",
+    # 只有被索引的列变化时才更新索引，last_seen等列的写入不受影响
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, name, location, about_me ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, username, name, location, about_me) "
+    "VALUES ('delete', old.id, old.username, old.name, old.location, old.about_me); "
+    "INSERT INTO users_fts(rowid, username, name, location, about_me) "
+    "VALUES (new.id, new.username, new.name, new.location, new.about_me); END",
+]
+
+FTS_DROP = [
+    'DROP TRIGGER IF EXISTS users_fts_au',
+    'DROP TRIGGER IF EXISTS users_fts_ad',
+    'DROP TRIGGER IF EXISTS users_fts_ai',
+    'DROP TABLE IF EXISTS users_fts',
+]
+
+# 各列的bm25权重：用户名、姓名、所在地、自我介绍
+RANK = 'bm25(users_fts, 10.0, 5.0, 2.0, 1.0)'
+
+for _statement in FTS_SCHEMA:
+    event.listen(User.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in FTS_DROP:
+    event.listen(User.__table__, 'before_drop', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+def fts_query(q):
+    """把用户输入转换为FTS5查询：每个词加引号，多个词之间为AND。
+
+    至少两个字符的词做前缀匹配；单个字符的前缀无法使用prefix索引，且几乎匹配所有行，只做完整匹配。
+    """
+    terms = re.findall(r'\w+', q or '')
+    return ' '.join('"%s"*' % term if len(term) > 1 else '"%s"' % term for term in terms[:8])
+
+
+def like_pattern(q):
+    """转义LIKE中的通配符，用户输入的%和_按普通字符匹配。"""
+    escaped = q.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped + '%'
+
+
+def search_users(q, page=1, per_page=20):
+    """按相关度返回第page页的(用户列表, 是否有下一页)。
+
+    SQLite使用FTS5索引，只对按rowid顺序的前FLASKY_SEARCH_RANK_LIMIT个匹配计算bm25并排序，
+    宽泛的查询（如常见的短前缀）耗时不随匹配数增长；其他数据库退回到LIKE查询，只适合小数据量。
+    """
+    match = fts_query(q)
+    if not match:
+        return [], False
+    offset = (page - 1) * per_page
+    if db.engine.dialect.name == 'sqlite':
+        users = User.query.from_statement(text(
+            'SELECT users.* FROM (SELECT rowid, %s AS score FROM users_fts '
+            'WHERE users_fts MATCH :q LIMIT :candidates) AS hits '
+            'JOIN users ON users.id = hits.rowid '
+            'ORDER BY hits.score LIMIT :limit OFFSET :offset' % RANK)
+            .columns(*User.__table__.columns)) \
+            .params(q=match, candidates=current_app.config['FLASKY_SEARCH_RANK_LIMIT'],
+                    limit=per_page + 1, offset=offset).all()
+        return users[:per_page], len(users) > per_page
+    pattern = like_pattern(q)
+    users = User.query.filter(or_(User.username.ilike(pattern, escape='\\'),
+                                  User.name.ilike(pattern, escape='\\'),
+                                  User.location.ilike(pattern, escape='\\'),
+                                  User.about_me.ilike(pattern, escape='\\'))) \
+        .order_by(User.username).offset(offset).limit(per_page + 1).all()
+    return users[:per_page], len(users) > per_page
+
+
+def rebuild_search_index(optimize=True):
+    """根据users表重建FTS5索引，返回(索引行数, 耗时毫秒)。"""
+    start = time.perf_counter()
+    with db.engine.begin() as conn:
+        for statement in FTS_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+        if optimize:
+            conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('optimize')"))
+        count = conn.execute(text('SELECT count(*) FROM users')).scalar()
+    return count, (time.perf_counter() - start) * 1000
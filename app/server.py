@@ -0,0 +1,185 @@
+import atexit
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from sqlalchemy.orm import configure_mappers
+from werkzeug.serving import make_server
+
+
+logger = logging.getLogger(__name__)
+
+
+def preload(app):
+    """在主进程中完成导入、映射配置、模板编译和数据预热，然后冻结GC。
+
+    冻结后这些对象不再被垃圾回收扫描，fork出的工作进程不会因为写入引用计数以外的GC标记
+    而复制这些内存页。数据库连接在fork前关闭，每个工作进程使用自己的连接。
+    """
+    from . import db, template_cache, taken_names
+    from .models import Role
+    with app.app_context():
+        configure_mappers()
+        template_cache.warm(app)
+        # 建立一次连接以完成方言初始化，再读取角色表
+        Role.query.all()
+        if app.config['FLASKY_REGISTRATION_BLOOM']:
+            taken_names.warm()
+        db.session.remove()
+        db.get_engine(app).dispose()
+    gc.collect()
+    gc.freeze()
+
+
+def warm_worker(app):
+    """在工作进程中预先建立连接池中的连接，第一个请求无需等待连接。"""
+    from . import db
+    with app.app_context():
+        engine = db.get_engine(app)
+        size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+        connections = [engine.connect() for _ in range(max(1, size))]
+        for conn in connections:
+            conn.close()
+
+
+def check_token_store(app, workers):
+    """多个工作进程使用进程内的令牌记录时，同一令牌在每个进程中都能使用一次，记录警告并返回False。"""
+    from .tokens import MemoryTokenStore
+    if workers > 1 and isinstance(app.extensions['tokens']['store'], MemoryTokenStore):
+        logger.warning('FLASKY_TOKEN_STORE_PATH is not set: each of the %d workers keeps its own '
+                       'record of used tokens, so a token can be used once per worker', workers)
+        return False
+    return True
+
+
+def memory_usage(pid):
+    """读取/proc中进程的内存占用(KB)：rss、pss以及共享和私有页。非Linux系统返回None。"""
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    usage = {'rss': 0, 'pss': 0, 'shared': 0, 'private': 0}
+    try:
+        with open('/proc/%d/smaps_rollup' % pid) as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    usage[fields[name]] += int(value.split()[0])
+    except OSError:
+        return None
+    return usage
+
+
+def format_memory(rows):
+    lines = ['%-8s %-8s %10s %10s %10s %10s' % ('role', 'pid', 'rss MB', 'pss MB', 'shared MB', 'private MB')]
+    totals = {'rss': 0, 'pss': 0}
+    for role, pid, usage in rows:
+        if usage is None:
+            lines.append('%-8s %-8d %10s' % (role, pid, 'n/a'))
+            continue
+        totals['rss'] += usage['rss']
+        totals['pss'] += usage['pss']
+        lines.append('%-8s %-8d %10.1f %10.1f %10.1f %10.1f'
+                     % (role, pid, usage['rss'] / 1024.0, usage['pss'] / 1024.0,
+                        usage['shared'] / 1024.0, usage['private'] / 1024.0))
+    # pss按共享进程数分摊共享页，合计值才是实际占用的内存
+    lines.append('%-8s %-8s %10.1f %10.1f' % ('total', '', totals['rss'] / 1024.0, totals['pss'] / 1024.0))
+    return '\n'.join(lines)
+
+
+class PreforkServer:
+    """主进程绑定端口后fork出固定数量的工作进程，共用同一个监听套接字。
+
+    工作进程异常退出时由主进程重新启动；主进程收到SIGINT或SIGTERM时通知所有工作进程退出。
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=2, threaded=True):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threaded = threaded
+        self.children = set()
+        self.running = False
+        self.server = None
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return pid
+        # 工作进程：SIGTERM时退出请求循环，执行atexit中的清理（如写入缓冲的访问时间）后直接退出，
+        # 不回到主进程的调用栈
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        code = 0
+        try:
+            warm_worker(self.app)
+            self.server.serve_forever()
+        except SystemExit:
+            pass
+        except BaseException:
+            logger.exception('Worker %d crashed', os.getpid())
+            code = 1
+        finally:
+            atexit._run_exitfuncs()
+            os._exit(code)
+
+    def _stop(self, signum, frame):
+        self.running = False
+
+    def memory_report(self):
+        rows = [('master', os.getpid(), memory_usage(os.getpid()))]
+        rows.extend(('worker', pid, memory_usage(pid)) for pid in sorted(self.children))
+        return format_memory(rows)
+
+    def serve(self, report_interval=0, echo=print):
+        check_token_store(self.app, self.workers)
+        self.server = make_server(self.host, self.port, self.app, threaded=self.threaded)
+        self.running = True
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        for _ in range(self.workers):
+            self._spawn()
+        echo('Serving on http://%s:%d with %d workers' % (self.host, self.port, self.workers))
+        next_report = time.monotonic() + (report_interval or 0)
+        try:
+            while self.running:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    pid = 0
+                if pid and pid in self.children:
+                    self.children.discard(pid)
+                    if self.running:
+                        logger.warning('Worker %d exited with status %d, restarting', pid, status)
+                        self._spawn()
+                    continue
+                if report_interval and time.monotonic() >= next_report:
+                    echo(self.memory_report())
+                    next_report = time.monotonic() + report_interval
+                time.sleep(0.2)
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout=10):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.discard(pid)
+        deadline = time.monotonic() + timeout
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.discard(pid)
+            else:
+                time.sleep(0.05)
+        for pid in list(self.children):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.clear()
+        self.server.server_close()
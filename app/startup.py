@@ -0,0 +1,67 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+# 在全新的解释器中导入flasky，输出总耗时和create_app中各步骤的耗时
+_PROBE = '''
+import json, time
+start = time.perf_counter()
+import flasky
+total = (time.perf_counter() - start) * 1000
+print(json.dumps({"total": total, "init": flasky.app.extensions["startup"]}))
+'''
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(text):
+    """解析python -X importtime的输出，返回[(模块名, 自身微秒, 累计微秒, 嵌套层级)]。"""
+    entries = []
+    for line in text.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            entries.append((name, int(own), int(cumulative), (len(indent) - 1) // 2))
+    return entries
+
+
+def package_breakdown(entries):
+    # 按顶层包汇总自身耗时，子模块的时间计入所属的包
+    packages = {}
+    for name, own, _, _ in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + own
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def run_startup_profile(config_name, lazy=False, cwd=None):
+    """在子进程中导入应用，返回导入明细和初始化耗时。"""
+    env = dict(os.environ, FLASK_CONFIG=config_name)
+    env['FLASKY_LAZY_EXTENSIONS'] = '1' if lazy else ''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE],
+                            cwd=cwd or os.getcwd(), env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'startup probe failed')
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    entries = parse_importtime(result.stderr)
+    return {
+        'total': probe['total'],
+        'init': probe['init'],
+        'imports': package_breakdown(entries),
+        'modules': len(entries),
+    }
+
+
+def format_startup_report(report, top=15):
+    lines = ['Import + create_app: %.1fms, %d modules imported' % (report['total'], report['modules']), '',
+             'Slowest packages to import:']
+    for package, us in report['imports'][:top]:
+        lines.append('  %9.1fms  %s' % (us / 1000.0, package))
+    lines.append('')
+    lines.append('create_app steps:')
+    for name, ms in report['init']:
+        lines.append('  %9.2fms  %s' % (ms, name))
+    return '\n'.join(lines)
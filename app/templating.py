@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+from jinja2 import FileSystemBytecodeCache
+
+
+class AtomicBytecodeCache(FileSystemBytecodeCache):
+    """多个进程共用的模板字节码缓存。
+
+    先写入临时文件再重命名，其他进程不会读到写了一半的缓存文件。
+    """
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.replace(tmp, filename)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+
+class TemplateCache:
+    """为应用的Jinja环境设置磁盘字节码缓存，并可在启动时预编译全部模板。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_TEMPLATE_CACHE_DIR', None)
+        app.config.setdefault('FLASKY_TEMPLATE_WARMUP', False)
+        directory = app.config['FLASKY_TEMPLATE_CACHE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = AtomicBytecodeCache(directory, '%s.cache')
+
+    def warm(self, app):
+        return warm_templates(app)
+
+
+def list_templates(app):
+    # 包括app/templates和各蓝本、扩展（如Flask-Bootstrap）提供的模板
+    return [name for name in app.jinja_env.list_templates() if name.endswith(('.html', '.txt'))]
+
+
+def warm_templates(app):
+    """编译（或从字节码缓存载入）全部模板，返回[(模板名, 毫秒)]。"""
+    timings = []
+    for name in list_templates(app):
+        start = time.perf_counter()
+        app.jinja_env.get_template(name)
+        timings.append((name, (time.perf_counter() - start) * 1000))
+    return timings
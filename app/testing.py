@@ -0,0 +1,81 @@
+import unittest
+from sqlalchemy import event
+from . import create_app, db, presence, user_cache, profile_cache, tokens, taken_names
+from .models import Role
+
+
+class FlaskyTestCase(unittest.TestCase):
+    """测试基类：每个进程只创建一次应用和数据表，每个测试在SAVEPOINT中执行并在结束后回滚。
+
+    直接通过db.engine提交的代码（如last_seen批量写入）会提交外层事务，
+    这类测试设置transactional = False，改为在测试结束后清空数据表。
+    """
+
+    transactional = True
+    config_name = 'testing'
+    _shared = {}
+
+    @classmethod
+    def setUpClass(cls):
+        shared = FlaskyTestCase._shared.get(cls.config_name)
+        if shared is None:
+            app = create_app(cls.config_name)
+            shared = FlaskyTestCase._shared[cls.config_name] = (app, dict(app.config))
+        cls.app = shared[0]
+        cls._config = shared[1]
+        # 使用数据库文件时，其他自建应用的测试可能已删除数据表，每个测试类开始前补建
+        with cls.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            db.session.remove()
+
+    def setUp(self):
+        # 恢复测试修改过的配置，重置进程内缓存
+        self.app.config.clear()
+        self.app.config.update(self._config)
+        for extension in (presence, user_cache, profile_cache, tokens, taken_names):
+            extension.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client(use_cookies=True)
+        if self.transactional:
+            self._begin()
+
+    def tearDown(self):
+        db.session.remove()
+        if self.transactional:
+            self._rollback()
+        else:
+            self._truncate()
+        self.app_context.pop()
+
+    def _begin(self):
+        self.connection = db.get_engine(self.app).connect()
+        self.transaction = self.connection.begin()
+        # pysqlite不会主动发出BEGIN，释放最外层的SAVEPOINT会直接提交，先显式开启事务
+        self.connection.execute('BEGIN')
+        db.session.remove()
+        # Flask-SQLAlchemy默认按表绑定到引擎，清空后所有语句都使用这个连接
+        db.session.configure(bind=self.connection, binds={})
+        session = db.session()
+        session.begin_nested()
+
+        # 测试代码提交或回滚后重新建立SAVEPOINT
+        @event.listens_for(session, 'after_transaction_end')
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                session.expire_all()
+                session.begin_nested()
+
+    def _rollback(self):
+        self.transaction.rollback()
+        self.connection.close()
+        for key in ('bind', 'binds'):
+            db.session.session_factory.kw.pop(key, None)
+
+    def _truncate(self):
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        Role.insert_roles()
+        db.session.remove()
@@ -0,0 +1,124 @@
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+
+
+class TimingResult(unittest.TextTestResult):
+    """记录每个测试耗时的结果对象，失败信息保存为字符串以便跨进程传递。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.durations = []
+        self._started = None
+
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        self.durations.append((test.id(), time.perf_counter() - self._started))
+
+
+def discover_modules(start_dir='tests', pattern='test*.py'):
+    return sorted(name for name in os.listdir(start_dir)
+                  if name.endswith('.py') and fnmatch(name, pattern))
+
+
+def _init_worker(database_dir):
+    # 子进程导入本模块时已经通过app导入了config，TestingConfig已读取过环境变量，
+    # 因此直接修改配置类；环境变量留给测试中再次启动的子进程
+    from config import config
+    if database_dir:
+        url = 'sqlite:///' + os.path.join(database_dir, 'test-%d.sqlite' % os.getpid())
+    else:
+        url = 'sqlite://'
+    os.environ['TEST_DATABASE_URL'] = url
+    config['testing'].SQLALCHEMY_DATABASE_URI = url
+
+
+def run_module(filename, start_dir='tests'):
+    """在当前进程中运行一个测试模块，返回可序列化的结果。"""
+    stream = io.StringIO()
+    suite = unittest.TestLoader().discover(start_dir, pattern=filename)
+    runner = unittest.TextTestRunner(stream=stream, verbosity=2, resultclass=TimingResult)
+    start = time.perf_counter()
+    result = runner.run(suite)
+    return {
+        'module': filename,
+        'run': result.testsRun,
+        'failures': [(test.id(), tb) for test, tb in result.failures],
+        'errors': [(test.id(), tb) for test, tb in result.errors],
+        'skipped': len(result.skipped),
+        'durations': result.durations,
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def run_parallel(modules, jobs, start_dir='tests', file_db=False):
+    """把测试模块分配到jobs个子进程中运行，按模块顺序返回结果。"""
+    database_dir = tempfile.mkdtemp(prefix='flasky-test-') if file_db else None
+    # 使用spawn启动全新的解释器，避免继承父进程中已创建的应用和连接
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                 initializer=_init_worker, initargs=(database_dir,)) as executor:
+            return list(executor.map(run_module, modules, [start_dir] * len(modules)))
+    finally:
+        if database_dir:
+            shutil.rmtree(database_dir, ignore_errors=True)
+
+
+def summarize(results):
+    return {
+        'run': sum(r['run'] for r in results),
+        'failures': [f for r in results for f in r['failures']],
+        'errors': [e for r in results for e in r['errors']],
+        'skipped': sum(r['skipped'] for r in results),
+        'durations': sorted((d for r in results for d in r['durations']),
+                            key=lambda d: d[1], reverse=True),
+    }
+
+
+def format_report(results, elapsed, jobs, slowest=10):
+    summary = summarize(results)
+    lines = []
+    for kind, items in (('ERROR', summary['errors']), ('FAIL', summary['failures'])):
+        for test_id, tb in items:
+            lines.append('=' * 70)
+            lines.append('%s: %s' % (kind, test_id))
+            lines.append('-' * 70)
+            lines.append(tb.rstrip())
+    lines.append('')
+    lines.append('%-24s %6s %9s' % ('module', 'tests', 'seconds'))
+    for r in results:
+        lines.append('%-24s %6d %9.2f' % (r['module'], r['run'], r['elapsed']))
+    if slowest and summary['durations']:
+        lines.append('')
+        lines.append('Slowest %d tests:' % min(slowest, len(summary['durations'])))
+        for test_id, seconds in summary['durations'][:slowest]:
+            lines.append('  %7.3fs %s' % (seconds, test_id))
+    lines.append('')
+    lines.append('Ran %d tests in %.2fs with %d jobs' % (summary['run'], elapsed, jobs))
+    problems = []
+    if summary['failures']:
+        problems.append('failures=%d' % len(summary['failures']))
+    if summary['errors']:
+        problems.append('errors=%d' % len(summary['errors']))
+    if summary['skipped']:
+        problems.append('skipped=%d' % summary['skipped'])
+    if summary['failures'] or summary['errors']:
+        lines.append('FAILED (%s)' % ', '.join(problems))
+    else:
+        lines.append('OK' + (' (%s)' % ', '.join(problems) if problems else ''))
+    return '\n'.join(lines)
+
+
+def was_successful(results):
+    return not any(r['failures'] or r['errors'] for r in results)
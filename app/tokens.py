@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+from itsdangerous import BadData, TimedJSONWebSignatureSerializer as Serializer
+
+
+def _digest(token):
+    return hashlib.sha1(token.encode('utf-8')).digest()
+
+
+class MemoryTokenStore:
+    """进程内的已使用令牌集合，过期的记录定期清理。"""
+
+    def __init__(self, purge_every=1000):
+        self._used = {}
+        self._lock = threading.Lock()
+        self._purge_every = purge_every
+        self._writes = 0
+
+    # 令牌第一次使用时返回True，重复使用返回False
+    def consume(self, token, expires_at):
+        key = _digest(token)
+        now = time.time()
+        with self._lock:
+            if self._used.get(key, 0) > now:
+                return False
+            self._used[key] = expires_at
+            self._writes += 1
+            if self._writes % self._purge_every == 0:
+                self._used = {k: v for k, v in self._used.items() if v > now}
+        return True
+
+    def __len__(self):
+        return len(self._used)
+
+
+class SQLiteTokenStore:
+    """保存在独立SQLite文件中的已使用令牌，多个工作进程共享。"""
+
+    def __init__(self, path, purge_every=1000):
+        self.path = path
+        self._local = threading.local()
+        self._purge_every = purge_every
+        self._writes = 0
+        self._connect().execute('CREATE TABLE IF NOT EXISTS consumed_tokens '
+                                '(digest BLOB PRIMARY KEY, expires_at INTEGER) WITHOUT ROWID')
+        # fork出的子进程不能继续使用父进程的连接
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def consume(self, token, expires_at):
+        conn = self._connect()
+        now = int(time.time())
+        key = _digest(token)
+        # 主键冲突且记录未过期说明令牌已被使用
+        cur = conn.execute('INSERT INTO consumed_tokens VALUES (?, ?) '
+                           'ON CONFLICT(digest) DO UPDATE SET expires_at = excluded.expires_at '
+                           'WHERE consumed_tokens.expires_at <= ?', (key, int(expires_at), now))
+        self._writes += 1
+        if self._writes % self._purge_every == 0:
+            conn.execute('DELETE FROM consumed_tokens WHERE expires_at <= ?', (now,))
+        return cur.rowcount == 1
+
+
+class Tokens:
+    """签名令牌：序列化器按用途加盐并按应用缓存，令牌只能使用一次。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_TOKEN_STORE_PATH', None)
+        path = app.config['FLASKY_TOKEN_STORE_PATH']
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        app.extensions['tokens'] = {
+            'serializers': {},
+            'store': SQLiteTokenStore(path) if path else MemoryTokenStore(),
+        }
+
+    @property
+    def state(self):
+        return current_app.extensions['tokens']
+
+    def serializer(self, purpose, expiration=900):
+        serializers = self.state['serializers']
+        key = (purpose, expiration)
+        s = serializers.get(key)
+        if s is None:
+            s = serializers.setdefault(key, Serializer(current_app.config['SECRET_KEY'], expiration,
+                                                       salt='flasky.' + purpose))
+        return s
+
+    def dumps(self, purpose, data, expiration=900):
+        return self.serializer(purpose, expiration).dumps(data).decode('utf-8')
+
+    # 令牌无效或过期时返回None
+    def loads(self, purpose, token):
+        try:
+            return self.serializer(purpose).loads(token.encode('utf-8'))
+        except BadData:
+            return None
+
+    # 标记令牌已使用；令牌第一次使用时返回True，重复使用或无效时返回False
+    def consume(self, purpose, token):
+        try:
+            data, header = self.serializer(purpose).loads(token.encode('utf-8'), return_header=True)
+        except BadData:
+            return False
+        return self.state['store'].consume(token, header.get('exp', 0))
@@ -12,11 +12,79 @@ class Config:
     FLASKY_MAIL_SUBJECT_PREFIX = '[Flasky]'
     FLASKY_MAIL_SENDER = 'Flasky Admin <f_totti_ac@sina.com>'
     FLASKY_ADMIN = os.environ.get('FLASKY_ADMIN')
+    # 注册时检查邮箱、用户名的布隆过滤器，容量和误判率决定内存占用
+    FLASKY_REGISTRATION_BLOOM = os.environ.get('FLASKY_REGISTRATION_BLOOM', 'true').lower() in ('1', 'true', 'yes')
+    FLASKY_REGISTRATION_BLOOM_CAPACITY = int(os.environ.get('FLASKY_REGISTRATION_BLOOM_CAPACITY', '1000000'))
+    FLASKY_REGISTRATION_BLOOM_ERROR_RATE = float(os.environ.get('FLASKY_REGISTRATION_BLOOM_ERROR_RATE', '0.01'))
+    # 开启时在create_app中加载注册预过滤器，避免第一次注册检查时扫描整个用户表
+    FLASKY_REGISTRATION_BLOOM_WARMUP = os.environ.get('FLASKY_REGISTRATION_BLOOM_WARMUP', '').lower() in ('1', 'true', 'yes')
+    # 已使用令牌的SQLite文件路径，多进程部署时共享；未设置时保存在进程内存中
+    FLASKY_TOKEN_STORE_PATH = os.environ.get('FLASKY_TOKEN_STORE_PATH')
+    # 请求级性能分析，开启后输出Server-Timing头并在FLASKY_METRICS_URL提供指标
+    FLASKY_PROFILING = os.environ.get('FLASKY_PROFILING', '').lower() in ('1', 'true', 'yes')
+    FLASKY_METRICS_URL = os.environ.get('FLASKY_METRICS_URL', '/metrics')
+    # outbox发送进程渲染邮件链接时使用的站点地址
+    FLASKY_BASE_URL = os.environ.get('FLASKY_BASE_URL', 'http://localhost:5000')
+    # outbox发送进程的发送线程数、发送队列容量，以及SMTP连接断开时的重连次数和首次退避秒数
+    FLASKY_MAIL_WORKERS = int(os.environ.get('FLASKY_MAIL_WORKERS', '2'))
+    FLASKY_MAIL_QUEUE_SIZE = int(os.environ.get('FLASKY_MAIL_QUEUE_SIZE', '100'))
+    FLASKY_MAIL_RETRIES = int(os.environ.get('FLASKY_MAIL_RETRIES', '3'))
+    FLASKY_MAIL_BACKOFF = float(os.environ.get('FLASKY_MAIL_BACKOFF', '1'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 用户最后访问时间：为True时每个请求同步提交，否则缓冲后批量写入
+    FLASKY_LAST_SEEN_SYNC = os.environ.get('FLASKY_LAST_SEEN_SYNC', '').lower() in ('1', 'true', 'yes')
+    FLASKY_LAST_SEEN_FLUSH_INTERVAL = float(os.environ.get('FLASKY_LAST_SEEN_FLUSH_INTERVAL', '30'))
+    FLASKY_LAST_SEEN_BATCH_SIZE = int(os.environ.get('FLASKY_LAST_SEEN_BATCH_SIZE', '500'))
+    # 用户加载缓存容量与过期秒数，容量为0时关闭缓存
+    FLASKY_USER_CACHE_SIZE = int(os.environ.get('FLASKY_USER_CACHE_SIZE', '1024'))
+    FLASKY_USER_CACHE_TTL = float(os.environ.get('FLASKY_USER_CACHE_TTL', '60'))
+    # 资料页渲染缓存的容量和过期秒数，以及不存在的用户名的缓存秒数
+    FLASKY_PROFILE_CACHE_SIZE = int(os.environ.get('FLASKY_PROFILE_CACHE_SIZE', '512'))
+    FLASKY_PROFILE_CACHE_TTL = float(os.environ.get('FLASKY_PROFILE_CACHE_TTL', '300'))
+    FLASKY_PROFILE_MISSING_TTL = float(os.environ.get('FLASKY_PROFILE_MISSING_TTL', '60'))
+    # 密码哈希算法及参数，如pbkdf2:sha256:150000，修改后旧哈希在用户登录时自动升级
+    FLASKY_PASSWORD_HASH_METHOD = os.environ.get('FLASKY_PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000')
+    FLASKY_PASSWORD_SALT_LENGTH = int(os.environ.get('FLASKY_PASSWORD_SALT_LENGTH', '8'))
+    # 密码哈希进程池：进程数、排队上限(0表示进程数的4倍)和等待超时秒数
+    FLASKY_HASH_SYNC = False
+    FLASKY_HASH_WORKERS = int(os.environ.get('FLASKY_HASH_WORKERS', str(os.cpu_count() or 1)))
+    FLASKY_HASH_QUEUE_DEPTH = int(os.environ.get('FLASKY_HASH_QUEUE_DEPTH', '0'))
+    FLASKY_HASH_TIMEOUT = float(os.environ.get('FLASKY_HASH_TIMEOUT', '5'))
+    # SQLite连接参数：WAL模式下写入不阻塞读取；cache_size为负数时单位是KB
+    FLASKY_SQLITE_WAL = os.environ.get('FLASKY_SQLITE_WAL', 'true').lower() in ('1', 'true', 'yes')
+    FLASKY_SQLITE_SYNCHRONOUS = os.environ.get('FLASKY_SQLITE_SYNCHRONOUS', 'NORMAL')
+    FLASKY_SQLITE_BUSY_TIMEOUT = int(os.environ.get('FLASKY_SQLITE_BUSY_TIMEOUT', '5000'))
+    FLASKY_SQLITE_CACHE_SIZE = int(os.environ.get('FLASKY_SQLITE_CACHE_SIZE', '-16000'))
+    FLASKY_SQLITE_MMAP_SIZE = int(os.environ.get('FLASKY_SQLITE_MMAP_SIZE', '0'))
+    # 数据库连接池大小、溢出连接数、回收秒数，以及取出连接前是否检测可用
+    FLASKY_DB_POOL_SIZE = int(os.environ.get('FLASKY_DB_POOL_SIZE', '5'))
+    FLASKY_DB_MAX_OVERFLOW = int(os.environ.get('FLASKY_DB_MAX_OVERFLOW', '10'))
+    FLASKY_DB_POOL_RECYCLE = int(os.environ.get('FLASKY_DB_POOL_RECYCLE', '3600'))
+    FLASKY_DB_POOL_PRE_PING = os.environ.get('FLASKY_DB_POOL_PRE_PING', '').lower() in ('1', 'true', 'yes')
+    # 延迟导入和初始化不常用的扩展（Flask-Mail、Flask-Moment、Flask-Migrate），加快命令行和新进程启动
+    FLASKY_LAZY_EXTENSIONS = os.environ.get('FLASKY_LAZY_EXTENSIONS', '').lower() in ('1', 'true', 'yes')
+    # 管理员用户目录每页显示的用户数，以及导出时每批读取的行数
+    FLASKY_USERS_PER_PAGE = int(os.environ.get('FLASKY_USERS_PER_PAGE', '50'))
+    FLASKY_EXPORT_BATCH_SIZE = int(os.environ.get('FLASKY_EXPORT_BATCH_SIZE', '1000'))
+    # 用户搜索每页结果数、最多可翻的页数，以及参与相关度排序的匹配数上限
+    FLASKY_SEARCH_PER_PAGE = int(os.environ.get('FLASKY_SEARCH_PER_PAGE', '20'))
+    FLASKY_SEARCH_MAX_PAGE = int(os.environ.get('FLASKY_SEARCH_MAX_PAGE', '50'))
+    FLASKY_SEARCH_RANK_LIMIT = int(os.environ.get('FLASKY_SEARCH_RANK_LIMIT', '1000'))
+    # 批量导入用户时每批插入的行数，以及每个哈希任务包含的密码数
+    FLASKY_IMPORT_BATCH_SIZE = int(os.environ.get('FLASKY_IMPORT_BATCH_SIZE', '1000'))
+    FLASKY_IMPORT_HASH_CHUNK = int(os.environ.get('FLASKY_IMPORT_HASH_CHUNK', '32'))
+    # Jinja模板字节码缓存目录，多个进程可共用；开启预热时在create_app中编译全部模板
+    FLASKY_TEMPLATE_CACHE_DIR = os.environ.get('FLASKY_TEMPLATE_CACHE_DIR')
+    FLASKY_TEMPLATE_WARMUP = os.environ.get('FLASKY_TEMPLATE_WARMUP', '').lower() in ('1', 'true', 'yes')
+    # 只读从库地址，多个用逗号分隔；设置后SELECT发往从库，写入及之后的读取使用主库
+    FLASKY_DB_REPLICA_URLS = [url for url in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if url]
 
     @staticmethod
     def init_app(app):
-        pass
+        from app.engine import configure_engine
+        from app.routing import configure_replicas
+        configure_engine(app)
+        configure_replicas(app)
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -25,13 +93,40 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    # 测试时在当前进程内同步计算哈希，并使用低成本的哈希参数
+    FLASKY_HASH_SYNC = True
+    FLASKY_PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1'
+    # 测试数据库用完即弃，不需要持久性保证
+    FLASKY_SQLITE_WAL = os.environ.get('FLASKY_SQLITE_WAL', '').lower() in ('1', 'true', 'yes')
+    FLASKY_SQLITE_SYNCHRONOUS = os.environ.get('FLASKY_SQLITE_SYNCHRONOUS', 'OFF')
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+    FLASKY_SQLITE_CACHE_SIZE = int(os.environ.get('FLASKY_SQLITE_CACHE_SIZE', '-64000'))
+    FLASKY_SQLITE_MMAP_SIZE = int(os.environ.get('FLASKY_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    FLASKY_DB_POOL_SIZE = int(os.environ.get('FLASKY_DB_POOL_SIZE', '10'))
+    FLASKY_DB_MAX_OVERFLOW = int(os.environ.get('FLASKY_DB_MAX_OVERFLOW', '20'))
+    FLASKY_DB_POOL_PRE_PING = os.environ.get('FLASKY_DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    FLASKY_TEMPLATE_CACHE_DIR = os.environ.get('FLASKY_TEMPLATE_CACHE_DIR') or os.path.join(basedir, 'tmp', 'jinja-cache')
+    FLASKY_TEMPLATE_WARMUP = os.environ.get('FLASKY_TEMPLATE_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+    FLASKY_REGISTRATION_BLOOM_WARMUP = os.environ.get('FLASKY_REGISTRATION_BLOOM_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+    # 多个工作进程共享已使用令牌的记录，否则同一令牌在每个进程中都能使用一次
+    FLASKY_TOKEN_STORE_PATH = os.environ.get('FLASKY_TOKEN_STORE_PATH') or os.path.join(basedir, 'tmp', 'tokens.sqlite')
+    # 生产环境没有默认的站点地址，未设置FLASKY_BASE_URL或SERVER_NAME时outbox发送进程拒绝启动
+    FLASKY_BASE_URL = os.environ.get('FLASKY_BASE_URL')
+
+# 压测使用生产配置，数据库由flask bench在临时目录中创建
+class BenchmarkConfig(ProductionConfig):
+    WTF_CSRF_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    # 哈希排队上限需大于压测并发数，否则登录和注册请求会因队列已满返回503
+    FLASKY_HASH_QUEUE_DEPTH = int(os.environ.get('FLASKY_HASH_QUEUE_DEPTH', '256'))
 
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
@@ -1,21 +1,191 @@
 # 运行前环境变量中需要先配置邮箱账号和密码。
 
 import os
+import click
+import sys
 from app import create_app, db
 from app.models import User, Role
-from flask_migrate import Migrate
 
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-migrate = Migrate(app, db)
+# flask命令行在加载应用前已导入Flask-Migrate的db命令，此时初始化没有额外开销；
+# 延迟模式下Web进程不导入Flask-Migrate
+if not app.config['FLASKY_LAZY_EXTENSIONS'] or 'flask_migrate' in sys.modules:
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
 
 @app.shell_context_processor
 def make_shell_context():
     return dict(db=db, User=User, Role=Role)
 
 @app.cli.command()
-def test():
+@click.option('--jobs', '-j', default=1, help='Run test modules in this many worker processes.')
+@click.option('--file-db', is_flag=True, help='Give each worker a temporary SQLite file instead of an in-memory database.')
+@click.option('--slowest', default=10, help='Number of slowest tests to list.')
+def test(jobs, file_db, slowest):
     """Run the unit tests."""
     import unittest
-    tests = unittest.TestLoader().discover('tests')
-    unittest.TextTestRunner(verbosity=2).run(tests)
\ No newline at end of file
+    if jobs <= 1:
+        tests = unittest.TestLoader().discover('tests')
+        unittest.TextTestRunner(verbosity=2).run(tests)
+        return
+    import time
+    from app.testrunner import discover_modules, run_parallel, format_report, was_successful
+    start = time.perf_counter()
+    results = run_parallel(discover_modules('tests'), jobs, file_db=file_db)
+    click.echo(format_report(results, time.perf_counter() - start, jobs, slowest))
+    if not was_successful(results):
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--host', default='127.0.0.1', help='Interface to bind.')
+@click.option('--port', default=5000, help='Port to bind.')
+@click.option('--workers', '-w', default=os.cpu_count() or 1, help='Number of worker processes.')
+@click.option('--threads/--no-threads', default=True, help='Handle requests in threads inside each worker.')
+@click.option('--memory-report', default=0.0, help='Print per-worker memory every N seconds (0 disables).')
+def serve(host, port, workers, threads, memory_report):
+    """Serve the app with preloaded, forked worker processes."""
+    from app.server import preload, PreforkServer
+    preload(app)
+    PreforkServer(app, host, port, workers, threads).serve(memory_report, echo=click.echo)
+
+@app.cli.command('startup-report')
+@click.option('--config', 'config_name', default=None, help='Configuration to profile (defaults to FLASK_CONFIG).')
+@click.option('--lazy/--eager', default=None, help='Force FLASKY_LAZY_EXTENSIONS on or off.')
+@click.option('--top', default=15, help='Number of packages to list.')
+def startup_report(config_name, lazy, top):
+    """Break down import and initialization time of a fresh worker."""
+    from app.startup import run_startup_profile, format_startup_report
+    if lazy is None:
+        lazy = app.config['FLASKY_LAZY_EXTENSIONS']
+    report = run_startup_profile(config_name or os.getenv('FLASK_CONFIG') or 'default', lazy,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+    click.echo(format_startup_report(report, top))
+
+@app.cli.command('compile-templates')
+def compile_templates():
+    """Compile every template and report the time each one took."""
+    from app.templating import warm_templates
+    timings = warm_templates(app)
+    for name, ms in sorted(timings, key=lambda t: t[1], reverse=True):
+        click.echo('%9.2fms  %s' % (ms, name))
+    click.echo('%d templates in %.2fms' % (len(timings), sum(ms for _, ms in timings)))
+    if app.jinja_env.bytecode_cache is not None:
+        click.echo('Bytecode cache: %s' % app.config['FLASKY_TEMPLATE_CACHE_DIR'])
+
+@app.cli.command('rebuild-search-index')
+@click.option('--no-optimize', is_flag=True, help='Skip merging index segments after the rebuild.')
+def rebuild_search_index(no_optimize):
+    """Rebuild the user full-text search index from the users table."""
+    from app.search import rebuild_search_index as rebuild
+    count, ms = rebuild(optimize=not no_optimize)
+    click.echo('Indexed %d users in %.0fms.' % (count, ms))
+
+@app.cli.command('import-users')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Input format (defaults to the file extension).')
+@click.option('--batch-size', default=None, type=int, help='Rows inserted per transaction.')
+@click.option('--checkpoint', type=click.Path(), help='File recording the last imported line; resumes from it.')
+@click.option('--confirmed/--unconfirmed', default=True, help='Confirmation state for rows without a confirmed column.')
+def import_users(path, fmt, batch_size, checkpoint, confirmed):
+    """Bulk import users from a CSV or NDJSON file ('-' for stdin)."""
+    import time
+    from app.importer import open_input, read_rows, detect_format, import_users as run_import
+    start_line = 0
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            start_line = int(f.read().strip() or 0)
+        click.echo('Resuming after line %d.' % start_line)
+    start = time.perf_counter()
+
+    def progress(stats):
+        # 每批提交后再记录检查点，中断时最多重新处理一批，已插入的行会被跳过
+        if checkpoint:
+            tmp = checkpoint + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(str(stats.line))
+            os.replace(tmp, checkpoint)
+        elapsed = time.perf_counter() - start
+        click.echo('line %d: %d inserted, %d existing, %d invalid (%.0f rows/s)'
+                   % (stats.line, stats.inserted, stats.existing, stats.invalid, stats.read / max(elapsed, 1e-6)))
+
+    with open_input(path) as stream:
+        stats = run_import(read_rows(stream, fmt or detect_format(path)), batch_size, start_line, confirmed, progress)
+    for line, error in stats.errors[:20]:
+        click.echo('line %d: %s' % (line, error), err=True)
+    if stats.invalid > 20:
+        click.echo('... %d more invalid rows' % (stats.invalid - 20), err=True)
+    click.echo('Imported %d users in %.1fs.' % (stats.inserted, time.perf_counter() - start))
+
+@app.cli.command('sync-replicas')
+def sync_replicas():
+    """Copy the primary SQLite database to every replica."""
+    from app.routing import sync_replicas as sync
+    for key in sync(app):
+        click.echo('Synced %s.' % key)
+
+@app.cli.command('outbox-worker')
+@click.option('--batch-size', default=100, help='Emails claimed per batch.')
+@click.option('--interval', default=5.0, help='Seconds to sleep when the outbox is empty.')
+@click.option('--workers', '-w', default=None, type=int, help='SMTP sender threads (defaults to FLASKY_MAIL_WORKERS).')
+@click.option('--once', is_flag=True, help='Process a single batch in this thread and exit.')
+def outbox_worker(batch_size, interval, workers, once):
+    """Deliver queued emails from the outbox table."""
+    import signal
+    import threading
+    from app.mailer import MailDispatcher
+    from app.outbox import process_outbox, run_worker, check_base_url
+    try:
+        check_base_url(app)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    if once:
+        click.echo('Sent %d email(s).' % process_outbox(batch_size))
+        return
+    dispatcher = MailDispatcher(app, workers=workers or app.config['FLASKY_MAIL_WORKERS'],
+                                queue_size=app.config['FLASKY_MAIL_QUEUE_SIZE'],
+                                retries=app.config['FLASKY_MAIL_RETRIES'],
+                                backoff=app.config['FLASKY_MAIL_BACKOFF'])
+    stop = threading.Event()
+
+    # 收到信号后不再认领新的记录，发送完已认领的邮件再退出
+    def request_stop(signum, frame):
+        click.echo('Stopping after the claimed emails are sent...')
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    run_worker(dispatcher, batch_size, interval, stop, echo=click.echo)
+
+
+@app.cli.command()
+@click.option('--url', default='http://localhost:5000/metrics', help='Metrics URL of a running server.')
+def metrics(url):
+    """Print per-endpoint timing histograms from a running server."""
+    from urllib.request import urlopen
+    with urlopen(url) as response:
+        click.echo(response.read().decode('utf-8'), nl=False)
+
+
+@app.cli.command()
+@click.option('--users', default=1000, help='Users seeded into the scratch database.')
+@click.option('--requests', default=500, help='Requests per endpoint.')
+@click.option('--concurrency', default=8, help='Concurrent clients per endpoint.')
+@click.option('--endpoint', 'endpoints', multiple=True, help='Only benchmark these endpoints.')
+@click.option('--config', 'config_name', default='benchmark', help='Configuration to benchmark.')
+@click.option('--output', type=click.Path(), help='Write results as JSON.')
+@click.option('--baseline', type=click.Path(exists=True), help='Fail if results regress against this JSON file.')
+@click.option('--threshold', default=0.2, help='Allowed relative regression against the baseline.')
+def bench(users, requests, concurrency, endpoints, config_name, output, baseline, threshold):
+    """Benchmark the auth and profile endpoints."""
+    from app.bench import run_benchmark, format_results, save_results, load_results, compare
+    results = run_benchmark(config_name, users, requests, concurrency, endpoints)
+    click.echo(format_results(results))
+    if output:
+        save_results(output, results)
+    if baseline:
+        regressions = compare(results, load_results(baseline), threshold)
+        for line in regressions:
+            click.echo('REGRESSION ' + line, err=True)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,58 @@
+"""normalized email and username lookup columns
+
+Revision ID: 8c4f1a2e6d93
+Revises: 5b2e8d1c9a47
+Create Date: 2026-10-18 11:05:17.520931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4f1a2e6d93'
+down_revision = '5b2e8d1c9a47'
+branch_labels = None
+depends_on = None
+
+# 每批回填的行数，避免大表在一个事务中长时间锁表
+BATCH_SIZE = 1000
+
+
+def _normalize(value):
+    return value.strip().lower() if value else value
+
+
+def upgrade():
+    op.add_column('users', sa.Column('email_normalized', sa.String(length=64), nullable=True))
+    op.add_column('users', sa.Column('username_normalized', sa.String(length=64), nullable=True))
+
+    # 按主键分批回填规范化的列
+    conn = op.get_bind()
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('email', sa.String),
+                     sa.column('username', sa.String), sa.column('email_normalized', sa.String),
+                     sa.column('username_normalized', sa.String))
+    update = users.update().where(users.c.id == sa.bindparam('uid')) \
+        .values(email_normalized=sa.bindparam('e'), username_normalized=sa.bindparam('u'))
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select([users.c.id, users.c.email, users.c.username])
+                            .where(users.c.id > last_id)
+                            .order_by(users.c.id).limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        conn.execute(update, [{'uid': row.id, 'e': _normalize(row.email), 'u': _normalize(row.username)}
+                              for row in rows])
+        last_id = rows[-1].id
+
+    # 回填完成后再建唯一索引；已有仅大小写不同的重复记录时需先人工合并
+    op.create_index(op.f('ix_users_email_normalized'), 'users', ['email_normalized'], unique=True)
+    op.create_index(op.f('ix_users_username_normalized'), 'users', ['username_normalized'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_users_username_normalized'), table_name='users')
+    op.drop_index(op.f('ix_users_email_normalized'), table_name='users')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('username_normalized')
+        batch_op.drop_column('email_normalized')
@@ -0,0 +1,40 @@
+"""user directory indexes
+
+Revision ID: d4a7e91b2c60
+Revises: c71d3e9f0b28
+Create Date: 2026-10-18 20:35:12.408311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e91b2c60'
+down_revision = 'c71d3e9f0b28'
+branch_labels = None
+depends_on = None
+
+# 早期迁移没有包含资料页字段，只通过db.create_all()建表的数据库已有这些列
+PROFILE_COLUMNS = [
+    sa.Column('name', sa.String(length=64), nullable=True),
+    sa.Column('location', sa.String(length=64), nullable=True),
+    sa.Column('about_me', sa.Text(), nullable=True),
+    sa.Column('member_since', sa.DateTime(), nullable=True),
+    sa.Column('last_seen', sa.DateTime(), nullable=True),
+]
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    for column in PROFILE_COLUMNS:
+        if column.name not in existing:
+            op.add_column('users', column)
+    op.create_index(op.f('ix_users_member_since'), 'users', ['member_since'], unique=False)
+    op.create_index(op.f('ix_users_role_id'), 'users', ['role_id'], unique=False)
+
+
+def downgrade():
+    # 只删除索引，补齐的资料页字段与模型一致，保留
+    op.drop_index(op.f('ix_users_role_id'), table_name='users')
+    op.drop_index(op.f('ix_users_member_since'), table_name='users')
@@ -0,0 +1,49 @@
+"""users full-text search index
+
+Revision ID: e5f2c8a4b713
+Revises: d4a7e91b2c60
+Create Date: 2026-10-18 20:41:37.902214
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f2c8a4b713'
+down_revision = 'd4a7e91b2c60'
+branch_labels = None
+depends_on = None
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "username, name, location, about_me, content='users', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, username, name, location, about_me) "
+    "VALUES (new.id, new.username, new.name, new.location, new.about_me); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, username, name, location, about_me) "
+    "VALUES ('delete', old.id, old.username, old.name, old.location, old.about_me); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, name, location, about_me ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, username, name, location, about_me) "
+    "VALUES ('delete', old.id, old.username, old.name, old.location, old.about_me); "
+    "INSERT INTO users_fts(rowid, username, name, location, about_me) "
+    "VALUES (new.id, new.username, new.name, new.location, new.about_me); END",
+]
+
+
+def upgrade():
+    # FTS5是SQLite特有的；其他数据库上搜索退回到LIKE查询
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in SCHEMA:
+        op.execute(statement)
+    op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in ('users_fts_au', 'users_fts_ad', 'users_fts_ai'):
+        op.execute('DROP TRIGGER IF EXISTS %s' % name)
+    op.execute('DROP TABLE IF EXISTS users_fts')
@@ -1,23 +1,90 @@
+import os
+import shutil
+import tempfile
 import unittest
 from flask import current_app
-from app import create_app, db
+from sqlalchemy.pool import QueuePool
+from app import create_app, db, mail, template_cache
+from config import config, TestingConfig
+from app.engine import configure_engine
+from app.startup import parse_importtime, package_breakdown
+from app.testing import FlaskyTestCase
 
 
-class BasicsTestCase(unittest.TestCase):
+# 基类在每个测试前激活应用上下文，以便在测试环境中使用current_app。
+class BasicsTestCase(FlaskyTestCase):
+    def test_app_exists(self):
+        self.assertFalse(current_app is None)
+
+    def test_app_is_testing(self):
+        self.assertTrue(current_app.config['TESTING'])
+
+class EngineTuningTestCase(unittest.TestCase):
     def setUp(self):
+        self.workdir = tempfile.mkdtemp()
         self.app = create_app('testing')
-        # 激活上下文，以便在测试环境中使用current_app。
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.workdir, 'test.sqlite')
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+        self.app.config['FLASKY_SQLITE_WAL'] = True
+        configure_engine(self.app)
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
+        db.get_engine(self.app).dispose()
+        shutil.rmtree(self.workdir, ignore_errors=True)
 
-    def test_app_exists(self):
-        self.assertFalse(current_app is None)
+    def test_sqlite_file_pragmas_and_pool(self):
+        options = self.app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        self.assertIs(options['poolclass'], QueuePool)
+        self.assertEqual(options['pool_size'], self.app.config['FLASKY_DB_POOL_SIZE'])
+        with db.get_engine(self.app).connect() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), 0)
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').scalar(), 5000)
 
-    def test_app_is_testing(self):
-        self.assertTrue(current_app.config['TESTING'])
\ No newline at end of file
+
+class TemplateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_warmup_fills_bytecode_cache(self):
+        app = create_app('testing')
+        app.config['FLASKY_TEMPLATE_CACHE_DIR'] = self.workdir
+        template_cache.init_app(app)
+        timings = template_cache.warm(app)
+        names = [name for name, _ in timings]
+        self.assertIn('user.html', names)
+        self.assertIn('auth/email/confirm.txt', names)
+        self.assertEqual(len([f for f in os.listdir(self.workdir) if f.endswith('.cache')]), len(names))
+
+
+class LazyExtensionsTestCase(unittest.TestCase):
+    def test_mail_and_moment_initialized_on_first_use(self):
+        config['testing-lazy'] = type('LazyTestingConfig', (TestingConfig,), {'FLASKY_LAZY_EXTENSIONS': True})
+        self.addCleanup(config.pop, 'testing-lazy')
+        app = create_app('testing-lazy')
+        self.assertNotIn('mail', app.extensions)
+        self.assertNotIn('moment', app.extensions)
+        with app.app_context():
+            with mail.record_messages() as outbox:
+                self.assertIn('mail', app.extensions)
+                self.assertEqual(outbox, [])
+            db.create_all()
+            response = app.test_client().get('/')
+            self.assertIn('moment', app.extensions)
+            self.assertIn(b'moment', response.data)
+            db.session.remove()
+            db.drop_all()
+
+    def test_parse_importtime(self):
+        text = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       100 |        300 |   sqlalchemy.sql',
+            'import time:       200 |        500 | sqlalchemy',
+            'import time:        50 |         50 | app',
+        ])
+        entries = parse_importtime(text)
+        self.assertEqual(entries[0], ('sqlalchemy.sql', 100, 300, 1))
+        self.assertEqual(package_breakdown(entries), [('sqlalchemy', 300), ('app', 50)])
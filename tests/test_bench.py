@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app.bench import percentile, compare, save_results, load_results
+
+
+def result(rps, p95, errors=0):
+    return {'requests': 100, 'errors': errors, 'error_rate': errors / 100.0,
+            'rps': rps, 'p50': p95 / 2, 'p95': p95, 'p99': p95 * 2}
+
+
+class BenchTestCase(unittest.TestCase):
+    # 验证最近秩法百分位数
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    # 验证只有超出阈值的吞吐下降或延迟上升才算回归
+    def test_compare_threshold(self):
+        baseline = {'auth.login': result(100.0, 10.0), 'main.user': result(200.0, 5.0)}
+        self.assertEqual(compare({'auth.login': result(81.0, 11.9)}, baseline, 0.2), [])
+        regressions = compare({'auth.login': result(79.0, 12.1), 'main.user': result(200.0, 5.0)}, baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith('auth.login:') for line in regressions))
+        # 基线中没有的端点不参与比较
+        self.assertEqual(compare({'auth.register': result(1.0, 1000.0)}, baseline, 0.2), [])
+
+    # 验证错误率高于基线时即使延迟更低也算回归，兼容没有error_rate字段的旧基线
+    def test_compare_error_rate(self):
+        baseline = {'auth.login': result(100.0, 10.0, errors=1)}
+        regressions = compare({'auth.login': result(300.0, 2.0, errors=50)}, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('error rate 50.0% vs baseline 1.0%', regressions[0])
+        self.assertEqual(compare({'auth.login': result(100.0, 10.0, errors=1)}, baseline, 0.2), [])
+        old = {'auth.login': {'requests': 100, 'errors': 0, 'rps': 100.0, 'p95': 10.0}}
+        self.assertEqual(len(compare({'auth.login': result(100.0, 10.0, errors=2)}, old, 0.2)), 1)
+
+    # 验证结果写入JSON后可作为基线读回
+    def test_results_round_trip(self):
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, 'bench.json')
+            results = {'main.user': result(200.0, 5.0)}
+            save_results(path, results)
+            self.assertEqual(load_results(path), results)
+            self.assertEqual(compare(results, load_results(path)), [])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,216 @@
+import json
+import unittest
+from app import create_app, db, profiler, user_cache
+from app.models import User, Role
+from app.querybudget import QueryBudgetMixin, QueryCapture, QueryBudgetExceeded, check_budget
+from app.search import fts_query, like_pattern
+from app.testing import FlaskyTestCase
+
+
+class FlaskClientTestCase(FlaskyTestCase):
+    def test_home_page(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('Stranger' in response.get_data(as_text=True))
+
+    # 验证资料页的条件请求
+    def test_profile_conditional_get(self):
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        response = self.client.get('/user/John')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('john' in response.get_data(as_text=True))
+        etag = response.headers['ETag']
+        response = self.client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        # 资料更新后ETag改变
+        u.location = 'Beijing'
+        db.session.commit()
+        response = self.client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('Beijing' in response.get_data(as_text=True))
+
+    # 验证不存在的用户名被缓存，注册后失效
+    def test_profile_negative_cache(self):
+        self.assertEqual(self.client.get('/user/susan').status_code, 404)
+        u = User(email='susan@example.com', username='susan', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertEqual(self.client.get('/user/susan').status_code, 200)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, FlaskyTestCase):
+    # 验证注册、登录、确认和资料页都在声明的查询预算内
+    def test_account_flow_budgets(self):
+        self.assertQueryBudget('GET', '/')
+        response = self.assertQueryBudget('POST', '/auth/register', data={
+            'email': 'john@example.com', 'username': 'john',
+            'password': 'cat', 'password2': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        response = self.assertQueryBudget('POST', '/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        token = User.query.first().generate_confirmation_token()
+        user_cache.invalidate()
+        self.assertQueryBudget('GET', '/auth/confirm/' + token)
+        user_cache.invalidate()
+        response = self.assertQueryBudget('GET', '/user/john')
+        self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('GET', '/auth/logout')
+
+    # 验证超出预算时测试失败
+    def test_budget_exceeded(self):
+        with QueryCapture() as capture:
+            for i in range(3):
+                User.query.get(i + 1)
+        with self.assertRaises(QueryBudgetExceeded):
+            check_budget(capture, 'test', 2)
+        with self.assertRaises(QueryBudgetExceeded):
+            check_budget(capture, 'test', None)
+
+
+class AdminDirectoryTestCase(QueryBudgetMixin, FlaskyTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = Role.query.filter_by(name='Administrator').first()
+        user = Role.query.filter_by(name='User').first()
+        db.session.add(User(email='admin@example.com', username='admin', password='cat',
+                            role=admin, confirmed=True))
+        for i in range(5):
+            db.session.add(User(email='u%d@example.com' % i, username='u%d' % i, password='cat',
+                                role=user, confirmed=i % 2 == 0))
+        db.session.commit()
+
+    def login(self, email):
+        return self.client.post('/auth/login', data={'email': email, 'password': 'cat'})
+
+    def test_requires_admin(self):
+        self.login('u0@example.com')
+        self.assertEqual(self.client.get('/admin/users').status_code, 403)
+        self.assertEqual(self.client.get('/admin/users/export').status_code, 403)
+
+    # 验证键集分页及按角色、确认状态过滤
+    def test_keyset_pagination_and_filters(self):
+        self.login('admin@example.com')
+        user_cache.invalidate()
+        response = self.assertQueryBudget('GET', '/admin/users?role=User&per_page=2')
+        data = response.get_data(as_text=True)
+        self.assertIn('u0', data)
+        self.assertNotIn('>admin<', data)
+        self.assertIn('after=3', data)
+        data = self.client.get('/admin/users?role=User&per_page=2&after=3').get_data(as_text=True)
+        self.assertIn('u2', data)
+        self.assertNotIn('>u1<', data)
+        data = self.client.get('/admin/users?confirmed=0').get_data(as_text=True)
+        self.assertIn('u1', data)
+        self.assertNotIn('>u0<', data)
+        self.assertEqual(self.client.get('/admin/users?since=yesterday').status_code, 400)
+
+    def test_streaming_export(self):
+        self.login('admin@example.com')
+        self.app.config['FLASKY_EXPORT_BATCH_SIZE'] = 2
+        response = self.client.get('/admin/users/export?format=csv')
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], 'id,username,email,role,confirmed,member_since,last_seen')
+        self.assertEqual(len(lines), 7)
+        response = self.client.get('/admin/users/export?format=ndjson&role=User&confirmed=1')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['u0', 'u2', 'u4'])
+        self.assertEqual(rows[0]['role'], 'User')
+
+
+class SearchTestCase(QueryBudgetMixin, FlaskyTestCase):
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([
+            User(email='a@example.com', username='alice', password='cat', confirmed=True,
+                 about_me='I moved from Shanghai to Berlin'),
+            User(email='s@example.com', username='shanghai_bob', password='cat', confirmed=True),
+            User(email='c@example.com', username='carol', password='cat', confirmed=True,
+                 name='Carol Shang', location='Beijing'),
+        ])
+        db.session.commit()
+        # 应用在测试之间共用，测试中修改的配置需要还原
+        self.saved_config = {key: self.app.config[key]
+                             for key in ('FLASKY_SEARCH_PER_PAGE', 'FLASKY_SEARCH_RANK_LIMIT')}
+
+    def tearDown(self):
+        self.app.config.update(self.saved_config)
+        super().tearDown()
+
+    def usernames(self, q, **params):
+        response = self.assertQueryBudget('GET', '/search', query_string=dict(q=q, **params))
+        self.assertEqual(response.status_code, 200)
+        data = response.get_data(as_text=True)
+        return [name for name in ('shanghai_bob', 'alice', 'carol') if '>%s<' % name in data], data
+
+    # 验证前缀匹配及用户名权重高于自我介绍
+    def test_ranked_prefix_search(self):
+        names, data = self.usernames('shang')
+        self.assertEqual(set(names), {'shanghai_bob', 'alice', 'carol'})
+        self.assertLess(data.index('>shanghai_bob<'), data.index('>alice<'))
+        names, _ = self.usernames('shang beijing')
+        self.assertEqual(names, ['carol'])
+        self.assertEqual(self.client.get('/search?q=x&page=0').status_code, 404)
+
+    # 验证修改和删除用户后索引随之更新
+    def test_index_follows_changes(self):
+        carol = User.query.filter_by(username='carol').first()
+        carol.location = 'Hangzhou'
+        db.session.delete(User.query.filter_by(username='alice').first())
+        db.session.commit()
+        self.assertEqual(self.usernames('hangzhou')[0], ['carol'])
+        self.assertEqual(self.usernames('beijing')[0], [])
+        self.assertEqual(self.usernames('berlin')[0], [])
+
+    def test_pagination(self):
+        self.app.config['FLASKY_SEARCH_PER_PAGE'] = 2
+        _, data = self.usernames('shang')
+        self.assertIn('page=2', data)
+        names, data = self.usernames('shang', page=2)
+        self.assertEqual(len(names), 1)
+        self.assertNotIn('page=3', data)
+
+    # 验证单字符只做完整匹配、参与排序的匹配数有上限，以及LIKE通配符被转义
+    def test_broad_queries(self):
+        self.assertEqual(fts_query('a Shang'), '"a" "Shang"*')
+        self.assertEqual(self.usernames('s')[0], [])
+        self.app.config['FLASKY_SEARCH_RANK_LIMIT'] = 2
+        names, data = self.usernames('shang')
+        self.assertEqual(len(names), 2)
+        self.assertNotIn('page=2', data)
+        self.assertEqual(like_pattern('50%_off'), '%50\\%\\_off%')
+
+
+# 性能分析会在应用上注册钩子，使用单独的应用实例
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_PROFILING'] = True
+        profiler.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 验证开启性能分析后输出Server-Timing头和指标
+    def test_profiling(self):
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        response = self.client.get('/user/john')
+        timing = response.headers['Server-Timing']
+        self.assertIn('sql;dur=', timing)
+        self.assertNotIn('desc="0 queries', timing)
+        self.assertIn('render;dur=', timing)
+        metrics = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('flasky_request_duration_ms_count{endpoint="main.user"} 1', metrics)
+        self.assertIn('flasky_sql_queries_total{endpoint="main.user"}', metrics)
@@ -0,0 +1,198 @@
+import os
+import shutil
+import smtplib
+import tempfile
+import unittest
+import threading
+import warnings
+from flask_mail import Message
+from app import create_app, db, mail
+from app.mailer import MailDispatcher, deliver
+from app.models import User, Outbox
+from app.outbox import queue_email, process_outbox, run_worker
+from app.testing import FlaskyTestCase
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    try:
+        import asyncore
+        import smtpd
+    except ImportError:
+        smtpd = None
+
+
+if smtpd is not None:
+    # 本地SMTP测试服务器，记录收到的邮件和连接次数
+    class SinkServer(smtpd.SMTPServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.connections = 0
+            self.received = []
+
+        def handle_accepted(self, conn, addr):
+            self.connections += 1
+            super().handle_accepted(conn, addr)
+
+        def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+            self.received.append(rcpttos)
+
+
+class DeliverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def message(self, i):
+        return Message('hello %d' % i, sender='a@example.com', recipients=['u%d@example.com' % i], body='hi')
+
+    # 验证被拒收的邮件不会引起重连，连接断开时才重新连接并重试
+    def test_deliver_mixed_batch(self):
+        class FakeConnection:
+            def __init__(self, log):
+                self.log = log
+
+            def __enter__(self):
+                self.log.append('connect')
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def send(self, msg):
+                subject = msg.subject
+                if subject == 'refused':
+                    raise smtplib.SMTPRecipientsRefused({'x@example.com': (550, b'no such user')})
+                if subject == 'disconnect' and 'disconnected' not in self.log:
+                    self.log.append('disconnected')
+                    raise smtplib.SMTPServerDisconnected('gone')
+                self.log.append(subject)
+
+        class FakeMail:
+            log = []
+
+            def connect(self):
+                return FakeConnection(self.log)
+
+        fake = FakeMail()
+        messages = [self.message(0), Message('refused', recipients=['x@example.com']),
+                    self.message(1), Message('disconnect', recipients=['y@example.com']), self.message(2)]
+        results = []
+        conn = deliver(fake, None, messages, retries=2, backoff=0,
+                       on_result=lambda i, error: results.append((i, error is None)))
+        self.assertIsNotNone(conn)
+        self.assertEqual(fake.log, ['connect', 'hello 0', 'hello 1', 'disconnected', 'connect',
+                                    'disconnect', 'hello 2'])
+        self.assertEqual(results, [(0, True), (1, False), (2, True), (3, True), (4, True)])
+
+
+class OutboxSMTPTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 验证一批邮件共用一条SMTP连接，无法发送的邮件不影响后面的邮件
+    @unittest.skipIf(smtpd is None, 'smtpd is not available')
+    def test_outbox_reuses_connection(self):
+        server = SinkServer(('127.0.0.1', 0), None, decode_data=True)
+        loop = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05}, daemon=True)
+        loop.start()
+        self.app.config.update(MAIL_SUPPRESS_SEND=False, MAIL_SERVER='127.0.0.1',
+                               MAIL_PORT=server.socket.getsockname()[1],
+                               MAIL_USE_TLS=False, MAIL_USERNAME=None)
+        self.app.extensions['mail'] = mail.init_mail(self.app.config, testing=False)
+        queue_email('bad\naddress@example.com', 'Hello', 'auth/email/confirm', user=None, token='abc')
+        for i in range(20):
+            queue_email('u%d@example.com' % i, 'Hello', 'auth/email/confirm', user=None, token='abc')
+        db.session.commit()
+        try:
+            self.assertEqual(process_outbox(), 20)
+        finally:
+            server.close()
+        self.assertEqual(len(server.received), 20)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(Outbox.query.filter_by(status='pending').count(), 1)
+
+
+# 发送线程使用各自的会话写入结果，需要一个文件数据库
+class OutboxDispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.workdir, 'outbox.sqlite')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # 验证停止信号到达后，已认领的邮件全部发出再退出，记录不会停留在sending状态
+    def test_stop_drains_claimed_batch(self):
+        queue_email('bad\naddress@example.com', 'Hello', 'auth/email/confirm', user=None, token='abc')
+        for i in range(30):
+            queue_email('u%d@example.com' % i, 'Hello', 'auth/email/confirm', user=None, token='abc')
+        db.session.commit()
+        stop = threading.Event()
+        dispatcher = MailDispatcher(self.app, workers=3, queue_size=2)
+        with mail.record_messages() as outbox:
+            # 认领第一批后立即请求停止
+            run_worker(dispatcher, batch_size=20, interval=0.01, stop=stop, echo=lambda line: stop.set())
+        self.assertEqual(len(outbox), 19)
+        db.session.remove()
+        counts = dict(db.session.query(Outbox.status, db.func.count()).group_by(Outbox.status).all())
+        self.assertEqual(counts, {'sent': 19, 'pending': 12})
+
+
+class OutboxTestCase(FlaskyTestCase):
+    # 验证outbox中的邮件被认领、渲染并标记为已发送
+    def test_process_outbox(self):
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add(u)
+        db.session.flush()
+        queue_email(u.email, 'Confirm Your Account', 'auth/email/confirm', user=u, token='abc')
+        db.session.commit()
+        with mail.record_messages() as outbox:
+            self.assertEqual(process_outbox(), 1)
+        self.assertEqual(len(outbox), 1)
+        self.assertIn('/auth/confirm/abc', outbox[0].body)
+        self.assertEqual(Outbox.query.first().status, 'sent')
+        self.assertEqual(process_outbox(), 0)
+
+    # 验证无法发送的记录放回队列，同一批中的其他邮件照常发出
+    def test_bad_entry_does_not_block_batch(self):
+        queue_email('bad\naddress@example.com', 'Hello', 'auth/email/confirm', user=None, token='abc')
+        for i in range(10):
+            queue_email('u%d@example.com' % i, 'Hello', 'auth/email/confirm', user=None, token='abc')
+        db.session.commit()
+        with mail.record_messages() as outbox:
+            self.assertEqual(process_outbox(), 10)
+        self.assertEqual(len(outbox), 10)
+        bad = Outbox.query.filter_by(status='pending').one()
+        self.assertEqual((bad.recipient, bad.attempts), ('bad\naddress@example.com', 1))
+
+    # 验证未配置站点地址时拒绝发送，只配置SERVER_NAME时链接使用该域名
+    def test_requires_base_url(self):
+        queue_email('john@example.com', 'Hello', 'auth/email/confirm', user=None, token='abc')
+        db.session.commit()
+        self.app.config['FLASKY_BASE_URL'] = None
+        with self.assertRaises(RuntimeError):
+            process_outbox()
+        self.assertEqual(Outbox.query.one().status, 'pending')
+        self.app.config['SERVER_NAME'] = 'flasky.example.com'
+        with mail.record_messages() as outbox:
+            self.assertEqual(process_outbox(), 1)
+        self.assertIn('http://flasky.example.com/auth/confirm/abc', outbox[0].body)
@@ -0,0 +1,31 @@
+import unittest
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.hashing import HashPool, HashingBusy
+
+
+class HashPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = HashPool(workers=1, queue_depth=1, timeout=5)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    # 验证进程池计算的哈希可以正常校验
+    def test_hash_in_process_pool(self):
+        pwhash = self.pool.run(generate_password_hash, 'cat')
+        self.assertTrue(self.pool.run(check_password_hash, pwhash, 'cat'))
+        self.assertFalse(self.pool.run(check_password_hash, pwhash, 'dog'))
+
+    # 验证队列已满时立即拒绝
+    def test_rejects_when_queue_full(self):
+        future = self.pool.submit(time.sleep, 0.5)
+        with self.assertRaises(HashingBusy):
+            self.pool.submit(time.sleep, 0)
+        future.result()
+
+    # 验证同步模式不创建进程池
+    def test_sync_fallback(self):
+        pool = HashPool(workers=1, queue_depth=1, timeout=5, sync=True)
+        self.assertTrue(pool.run(check_password_hash, generate_password_hash('cat'), 'cat'))
+        self.assertIsNone(pool._executor)
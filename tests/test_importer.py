@@ -0,0 +1,53 @@
+import io
+from app import taken_names
+from app.importer import read_rows, import_users
+from app.models import User, Role
+from app.testing import FlaskyTestCase
+
+
+CSV = '''email,username,password,role,name
+john@example.com,john,cat,,John
+susan@example.com,susan,dog,moderator,
+bad-email,nobody,x,,
+david@example.com,david,,,
+'''
+
+
+class ImportUsersTestCase(FlaskyTestCase):
+    # 验证导入的用户有规范化的列、角色和可用的密码
+    def test_import_csv(self):
+        stats = import_users(read_rows(io.StringIO(CSV), 'csv'), batch_size=2)
+        self.assertEqual((stats.read, stats.inserted, stats.invalid), (4, 2, 2))
+        self.assertEqual([line for line, _ in stats.errors], [4, 5])
+        self.assertIn('missing password', stats.errors[1][1])
+        john = User.lookup_email(' JOHN@example.com').first()
+        self.assertEqual(john.username_normalized, 'john')
+        self.assertEqual(john.name, 'John')
+        self.assertTrue(john.confirmed)
+        self.assertTrue(john.verify_password('cat'))
+        self.assertEqual(john.role, Role.query.filter_by(default=True).first())
+        self.assertEqual(User.lookup_username('susan').first().role.name, 'Moderator')
+        self.assertIsNone(User.lookup_username('david').first())
+        self.assertTrue(taken_names.may_contain_email('susan@example.com'))
+
+    # 验证从检查点或从头重新运行时不会重复插入
+    def test_resume(self):
+        progress = []
+        import_users(read_rows(io.StringIO(CSV), 'csv'), batch_size=1,
+                     progress=lambda stats: progress.append(stats.line))
+        self.assertEqual(progress[-1], 5)
+        stats = import_users(read_rows(io.StringIO(CSV), 'csv'), start_line=3)
+        self.assertEqual((stats.read, stats.inserted), (2, 0))
+        stats = import_users(read_rows(io.StringIO(CSV), 'csv'))
+        self.assertEqual((stats.inserted, stats.existing), (0, 2))
+        self.assertEqual(User.query.count(), 2)
+
+    # 验证NDJSON输入，同一文件中重复的用户只导入一次
+    def test_import_ndjson(self):
+        data = ('{"email": "john@example.com", "username": "john", "password": "cat", "confirmed": false}\n'
+                '\n'
+                'not json\n'
+                '{"email": "JOHN@example.com", "username": "john2", "password": "dog"}\n')
+        stats = import_users(read_rows(io.StringIO(data), 'ndjson'), confirmed=True)
+        self.assertEqual((stats.inserted, stats.existing, stats.invalid), (1, 1, 1))
+        self.assertFalse(User.lookup_username('john').first().confirmed)
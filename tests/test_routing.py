@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import User, Role
+from app.routing import configure_replicas, sync_replicas
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.workdir, 'primary.sqlite')
+        self.app.config['FLASKY_DB_REPLICA_URLS'] = ['sqlite:///' + os.path.join(self.workdir, 'replica.sqlite')]
+        configure_replicas(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        sync_replicas(self.app)
+        Role.insert_roles()
+        db.session.remove()
+        sync_replicas(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        for bind in (None, 'replica0'):
+            db.get_engine(self.app, bind=bind).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _insert_on_primary(self, username):
+        with db.get_engine(self.app).begin() as conn:
+            conn.execute(User.__table__.insert(), username=username, username_normalized=username,
+                         email=username + '@example.com', email_normalized=username + '@example.com')
+
+    def test_reads_go_to_replica(self):
+        self._insert_on_primary('john')
+        self.assertIsNone(User.query.filter_by(username='john').first())
+        db.session.remove()
+        sync_replicas(self.app)
+        self.assertIsNotNone(User.query.filter_by(username='john').first())
+
+    def test_reads_stick_to_primary_after_write(self):
+        self._insert_on_primary('john')
+        db.session.add(User(email='susan@example.com', username='susan', password='cat'))
+        db.session.commit()
+        self.assertIsNotNone(User.query.filter_by(username='susan').first())
+        self.assertIsNotNone(User.query.filter_by(username='john').first())
@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, tokens
+from app.server import memory_usage, format_memory, check_token_store
+
+
+class ServerMemoryReportTestCase(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), 'requires /proc smaps_rollup')
+    def test_memory_usage(self):
+        usage = memory_usage(os.getpid())
+        self.assertGreater(usage['rss'], 0)
+        self.assertEqual(usage['rss'], usage['shared'] + usage['private'])
+
+    def test_format_memory(self):
+        rows = [('master', 1, {'rss': 2048, 'pss': 1024, 'shared': 1024, 'private': 1024}),
+                ('worker', 2, {'rss': 2048, 'pss': 1024, 'shared': 1536, 'private': 512}),
+                ('worker', 3, None)]
+        report = format_memory(rows).splitlines()
+        self.assertIn('n/a', report[3])
+        self.assertEqual(report[-1].split()[1:], ['4.0', '2.0'])
+
+
+class TokenStoreCheckTestCase(unittest.TestCase):
+    # 验证多进程部署没有共享令牌记录时发出警告
+    def test_warns_without_shared_store(self):
+        app = create_app('testing')
+        self.assertTrue(check_token_store(app, 1))
+        with self.assertLogs('app.server', 'WARNING'):
+            self.assertFalse(check_token_store(app, 4))
+        workdir = tempfile.mkdtemp()
+        try:
+            app.config['FLASKY_TOKEN_STORE_PATH'] = os.path.join(workdir, 'tmp', 'tokens.sqlite')
+            tokens.init_app(app)
+            self.assertTrue(check_token_store(app, 4))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
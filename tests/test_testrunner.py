@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from app.testrunner import format_report, was_successful, run_parallel
+
+
+# 在子进程中运行的测试模块：建表并写入一行，记录所用的数据库地址
+PROBE = textwrap.dedent('''
+    import os
+    import unittest
+    from app import create_app, db
+    from app.models import Role
+
+
+    class ProbeTestCase(unittest.TestCase):
+        def test_database(self):
+            app = create_app('testing')
+            with app.app_context():
+                db.create_all()
+                db.session.add(Role(name='probe'))
+                db.session.commit()
+                uri = app.config['SQLALCHEMY_DATABASE_URI']
+                count = Role.query.count()
+                db.session.remove()
+                db.drop_all()
+            with open(os.path.join(os.environ['FLASKY_PROBE_DIR'], '%d' % os.getpid()), 'a') as f:
+                f.write('%s %d\\n' % (uri, count))
+''')
+
+
+class TestRunnerReportTestCase(unittest.TestCase):
+    def test_aggregate_report(self):
+        results = [
+            {'module': 'test_a.py', 'run': 2, 'failures': [], 'errors': [], 'skipped': 0,
+             'durations': [('test_a.A.test_fast', 0.01), ('test_a.A.test_slow', 1.5)], 'elapsed': 1.6},
+            {'module': 'test_b.py', 'run': 1, 'failures': [('test_b.B.test_x', 'Traceback\nAssertionError')],
+             'errors': [], 'skipped': 0, 'durations': [('test_b.B.test_x', 0.2)], 'elapsed': 0.3},
+        ]
+        report = format_report(results, 1.7, 2, slowest=2)
+        self.assertIn('FAIL: test_b.B.test_x', report)
+        self.assertIn('Ran 3 tests in 1.70s with 2 jobs', report)
+        self.assertIn('FAILED (failures=1)', report)
+        slowest = report.split('Slowest 2 tests:')[1]
+        self.assertLess(slowest.index('test_slow'), slowest.index('test_b.B.test_x'))
+        self.assertNotIn('test_fast', slowest)
+        self.assertFalse(was_successful(results))
+        self.assertTrue(was_successful(results[:1]))
+
+
+class ParallelRunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.tests_dir = os.path.join(self.workdir, 'tests')
+        self.probe_dir = os.path.join(self.workdir, 'probe')
+        os.makedirs(self.tests_dir)
+        os.makedirs(self.probe_dir)
+        for name in ('test_probe_a.py', 'test_probe_b.py'):
+            with open(os.path.join(self.tests_dir, name), 'w') as f:
+                f.write(PROBE)
+        os.environ['FLASKY_PROBE_DIR'] = self.probe_dir
+
+    def tearDown(self):
+        os.environ.pop('FLASKY_PROBE_DIR', None)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # 验证--file-db时每个工作进程使用自己的SQLite文件
+    def test_file_db_per_worker(self):
+        results = run_parallel(['test_probe_a.py', 'test_probe_b.py'], 2, self.tests_dir, file_db=True)
+        self.assertTrue(was_successful(results), results)
+        self.assertEqual(sum(r['run'] for r in results), 2)
+        uris = {}
+        for pid in os.listdir(self.probe_dir):
+            with open(os.path.join(self.probe_dir, pid)) as f:
+                lines = f.read().split()
+            uris[pid] = set(lines[0::2])
+            self.assertTrue(all(count == '1' for count in lines[1::2]))
+        for pid, urls in uris.items():
+            self.assertEqual(len(urls), 1)
+            url = urls.pop()
+            self.assertTrue(url.startswith('sqlite:///') and url.endswith('test-%s.sqlite' % pid), url)
@@ -0,0 +1,28 @@
+import unittest
+import os
+import tempfile
+import time
+from app.tokens import MemoryTokenStore, SQLiteTokenStore
+
+
+class TokenStoreTestCase(unittest.TestCase):
+    def check_store(self, store):
+        now = time.time()
+        self.assertTrue(store.consume('a', now + 60))
+        self.assertFalse(store.consume('a', now + 60))
+        self.assertTrue(store.consume('b', now + 60))
+        # 记录过期后同一令牌不再被拒绝，由签名校验负责拒绝过期令牌
+        self.assertTrue(store.consume('c', now - 1))
+        self.assertTrue(store.consume('c', now + 60))
+        self.assertFalse(store.consume('c', now + 60))
+
+    def test_memory_store(self):
+        self.check_store(MemoryTokenStore())
+
+    def test_sqlite_store(self):
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        try:
+            self.check_store(SQLiteTokenStore(path))
+        finally:
+            os.remove(path)
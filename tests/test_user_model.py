@@ -1,22 +1,16 @@
-import unittest
 import time
-from app import create_app, db
-from app.models import User, AnonymousUser, Role, Permission
+from datetime import datetime, timedelta
+from unittest import mock
+from flask_login import login_user, logout_user
+from sqlalchemy.exc import OperationalError
+from app import db, presence, user_cache, hasher, tokens, taken_names
+from app.models import User, AnonymousUser, Role, Permission, load_user
+from app.presence import PresenceBuffer
+from app.decorators import current_permissions
+from app.testing import FlaskyTestCase
 
 
-class UserModelTestCase(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        Role.insert_roles()
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
-
+class UserModelTestCase(FlaskyTestCase):
     def test_password_setter(self):
         u = User(password='cat')
         self.assertTrue(u.password_hash is not None)
@@ -31,6 +25,11 @@ class UserModelTestCase(unittest.TestCase):
         self.assertTrue(u.verify_password('cat'))
         self.assertFalse(u.verify_password('dog'))
 
+    # 没有设置密码的用户不能登录
+    def test_verify_without_password(self):
+        u = User()
+        self.assertFalse(u.verify_password('cat'))
+
     def test_password_salts_are_random(self):
         u = User(password='cat')
         u2 = User(password='cat')
@@ -134,3 +133,191 @@ class UserModelTestCase(unittest.TestCase):
         self.assertFalse((u.can(Permission.WRITE)))
         self.assertFalse((u.can(Permission.MODERATE)))
         self.assertFalse((u.can(Permission.ADMIN)))
+
+    # 验证用户加载缓存命中及提交修改后失效
+    def test_user_loader_cache(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        user_cache.invalidate()
+        self.assertEqual(load_user(str(u.id)).id, u.id)
+        self.assertEqual(user_cache.stats()['misses'], 1)
+        loaded = load_user(str(u.id))
+        self.assertEqual(user_cache.stats()['hits'], 1)
+        self.assertTrue(loaded.can(Permission.WRITE))
+        with self.assertRaises(AttributeError):
+            loaded.confirmed = True
+        loaded.user.confirmed = True
+        db.session.commit()
+        self.assertIsNone(user_cache.get(u.id))
+        self.assertTrue(load_user(str(u.id)).confirmed)
+
+    # 验证角色权限修改后缓存的权限位掩码随之更新
+    def test_role_change_refreshes_permissions(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(load_user(str(u.id)).can(Permission.MODERATE))
+        with self.app.test_request_context():
+            self.assertEqual(current_permissions(), 0)
+            login_user(u)
+            self.assertEqual(current_permissions(), u.role.permissions)
+            logout_user()
+            self.assertEqual(current_permissions(), 0)
+        role = Role.query.filter_by(name='User').first()
+        role.add_permission(Permission.MODERATE)
+        db.session.commit()
+        principal = load_user(str(u.id))
+        self.assertTrue(principal.can(Permission.MODERATE))
+        self.assertEqual(principal.permissions, role.permissions)
+        with self.app.test_request_context():
+            login_user(u)
+            self.assertEqual(current_permissions(), role.permissions)
+
+    # 验证令牌只能使用一次
+    def test_token_cannot_be_reused(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_reset_token()
+        self.assertTrue(User.reset_password(token, 'dog'))
+        self.assertFalse(User.reset_password(token, 'horse'))
+        self.assertTrue(u.verify_password('dog'))
+
+    # 验证不同用途的令牌不能混用
+    def test_token_purpose_is_salted(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_confirmation_token()
+        self.assertIsNone(tokens.loads('reset', token))
+        self.assertFalse(u.change_email_confirm(token))
+        self.assertTrue(u.confirm(token))
+
+    # 验证邮箱和用户名的注册检查
+    def test_taken(self):
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertEqual(User.taken('john@example.com', 'john'), (True, True))
+        self.assertEqual(User.taken('john@example.com', 'susan'), (True, False))
+        self.assertEqual(User.taken('susan@example.com', 'susan'), (False, False))
+        self.assertFalse(taken_names.may_contain_username('susan'))
+        u2 = User(email='susan@example.com', username='susan', password='dog')
+        db.session.add(u2)
+        db.session.commit()
+        self.assertTrue(taken_names.may_contain_username('susan'))
+        self.assertEqual(User.taken('susan@example.com', 'susan'), (True, True))
+
+    # 验证按邮箱和用户名查找不区分大小写
+    def test_case_insensitive_lookup(self):
+        u = User(email='John@Example.com', username='John', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertEqual(User.lookup_email('john@example.com ').first(), u)
+        self.assertEqual(User.lookup_username('JOHN').first(), u)
+        self.assertEqual(User.taken('JOHN@example.com', 'john'), (True, True))
+        u.email = 'New@Example.com'
+        db.session.commit()
+        self.assertEqual(u.email_normalized, 'new@example.com')
+        self.assertIsNone(User.lookup_email('john@example.com').first())
+
+
+# 这些测试直接通过db.engine写入数据，不能放在回滚的事务中
+class UserModelEngineTestCase(FlaskyTestCase):
+    transactional = False
+
+    # 验证启动时加载注册预过滤器，数据库不可用时留到第一次检查再加载
+    def test_warm_registration_filter(self):
+        db.session.add(User(email='john@example.com', username='john', password='cat'))
+        db.session.commit()
+        with mock.patch.object(taken_names, 'warm', side_effect=OperationalError('SELECT', {}, None)):
+            with self.assertLogs('app.bloom', 'WARNING'):
+                self.assertIsNone(taken_names.warm_app(self.app))
+        self.assertIsNone(self.app.extensions['taken_names']['filter'])
+        bloom = taken_names.warm_app(self.app)
+        self.assertIs(self.app.extensions['taken_names']['filter'], bloom)
+        self.assertIn(taken_names.username_key('john'), bloom)
+        self.assertFalse(taken_names.may_contain_username('susan'))
+
+    # 验证最后访问时间先写入缓冲区，批量刷新后落库
+    def test_ping_is_buffered(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        before, updated = u.last_seen, u.updated_at
+        time.sleep(0.01)
+        u.ping()
+        self.assertIn(u.id, presence.pending())
+        self.assertEqual(presence.flush(), 1)
+        db.session.expire(u)
+        self.assertTrue(u.last_seen > before)
+        self.assertEqual(u.updated_at, updated)
+        self.assertEqual(presence.pending(), {})
+
+    # 验证写入失败时记录放回缓冲区，期间的新访问时间不被旧值覆盖
+    def test_failed_flush_keeps_pending(self):
+        buffer = presence.buffer
+        old, new = datetime(2020, 1, 1), datetime(2020, 1, 2)
+        buffer.record(1, old)
+        buffer.record(2, old)
+
+        def locked(app):
+            buffer.record(2, new)
+            raise OperationalError('UPDATE users', {}, Exception('database is locked'))
+
+        with mock.patch.object(db, 'get_engine', side_effect=locked):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+        self.assertEqual(buffer.pending(), {1: old, 2: new})
+
+    # 验证没有新的访问时后台线程也会按时间间隔写入
+    def test_background_flush(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        buffer = PresenceBuffer(self.app, flush_interval=0.05)
+        seen = datetime.utcnow() + timedelta(hours=1)
+        try:
+            buffer.record(u.id, seen)
+            deadline = time.monotonic() + 5
+            while buffer.pending() and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            buffer.stop()
+        self.assertEqual(buffer.pending(), {})
+        db.session.expire(u)
+        self.assertEqual(u.last_seen, seen)
+
+    # 验证同步写入访问时间时资料修改时间不变
+    def test_sync_ping_keeps_updated_at(self):
+        saved = self.app.config['FLASKY_LAST_SEEN_SYNC']
+        self.app.config['FLASKY_LAST_SEEN_SYNC'] = True
+        try:
+            u = User(password='cat')
+            db.session.add(u)
+            db.session.commit()
+            before, updated = u.last_seen, u.updated_at
+            time.sleep(0.01)
+            u.ping()
+            self.assertTrue(u.last_seen > before)
+            self.assertEqual(u.updated_at, updated)
+        finally:
+            self.app.config['FLASKY_LAST_SEEN_SYNC'] = saved
+
+    # 验证登录成功时旧参数的哈希被升级
+    def test_outdated_hash_is_upgraded(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(hasher.needs_rehash(u.password_hash))
+        self.app.config['FLASKY_PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2'
+        old_hash, updated = u.password_hash, u.updated_at
+        self.assertTrue(hasher.needs_rehash(old_hash))
+        self.assertFalse(u.verify_password('dog'))
+        self.assertTrue(u.verify_password('cat'))
+        db.session.expire(u)
+        self.assertNotEqual(u.password_hash, old_hash)
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:2$'))
+        self.assertEqual(u.updated_at, updated)
+        self.assertTrue(u.verify_password('cat'))
@@ -0,0 +1,11 @@
+# 生产环境WSGI入口，例如：gunicorn --preload -w 4 wsgi:app
+# 应用在主进程中预热并冻结GC，fork出的工作进程共享这部分内存。
+# 使用gunicorn时可在post_fork钩子中调用app.server.warm_worker(app)预先建立数据库连接。
+
+import os
+from app import create_app
+from app.server import preload
+
+
+app = create_app(os.getenv('FLASK_CONFIG') or 'production')
+preload(app)